@@ -1,9 +1,32 @@
 import os
+import threading
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
\ No newline at end of file
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase():
+    """Create the Supabase client on first use instead of at import time"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from supabase import create_client
+                _client = create_client(url, key)
+    return _client
+
+
+class _LazyClient:
+    """Stand-in for the Supabase client that builds the real one on first attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(get_supabase(), name)
+
+
+supabase = _LazyClient()
@@ -1,4 +1,9 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, BackgroundTasks, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 from datetime import datetime, timedelta
@@ -6,14 +11,28 @@ from app.schemas import (
     BranchCreate,
     DepartmentCreate,
     EmissionLogCreate,
+    FactorRecalculationCreate,
     OrganizationCreate,
+    ScopeComparisonRequest,
 )
 from app.services.calculator import calculate_co2e
 from app.services.ingestor import process_csv_log
 from app.services.recommendation_engine import RecommendationEngine
+from app.services.anomaly_detector import detect_anomalies
+from app.services.comparison import compare_scopes
+from app.services.scheduler import scheduler, PRECOMPUTE_ENABLED
+from app.services.recalculator import claim_job, create_job, get_job, run_job
+from app.services.hot_store import hot_store
+from app.services.hierarchy import hierarchy
+from app.services.live_updates import live_hub, LIVE_UPDATES_REALTIME, SCOPE_TYPES
+from app.services.warmup import run_warmup, is_ready, readiness, timings_ms, IMPORT_TIME_BUDGET_MS
 from app.database import supabase
 import os
 
+IMPORT_TIME_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+if IMPORT_TIME_MS > IMPORT_TIME_BUDGET_MS:
+    print(f"Warning: app import took {IMPORT_TIME_MS} ms (budget {IMPORT_TIME_BUDGET_MS:.0f} ms)")
+
 app = FastAPI(title="Carbon-Setu API")
 
 # Configure CORS - allow production domains and get additional origins from env
@@ -40,11 +59,52 @@ app.add_middleware(
 )
 
 
+def _log_task_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_name()} failed: {task.exception()}")
+
+
+@app.on_event("startup")
+async def start_warmup():
+    """Run warm-up in the background so the process answers /livez immediately"""
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(run_warmup))
+    live_hub.bind(asyncio.get_running_loop())
+    if LIVE_UPDATES_REALTIME:
+        try:
+            await live_hub.start_realtime()
+        except Exception as e:
+            print(f"Realtime relay failed to start: {e}")
+    if PRECOMPUTE_ENABLED:
+        app.state.precompute_task = asyncio.create_task(scheduler.run_forever(), name="precompute-scheduler")
+        app.state.precompute_task.add_done_callback(_log_task_failure)
+
+
 @app.get("/")
 async def health_check():
     """Health check endpoint for Render"""
     return {"status": "healthy", "service": "Carbon-Setu API"}
 
+
+@app.get("/livez")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: connections are open and caches are warm"""
+    body = {
+        "status": "ready" if is_ready() else "warming",
+        "checks": readiness,
+        "timings_ms": timings_ms,
+        "import_time_ms": IMPORT_TIME_MS,
+        "import_time_budget_ms": IMPORT_TIME_BUDGET_MS,
+    }
+    if not is_ready():
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.get("/organizations")
 async def get_organizations():
     try:
@@ -78,6 +138,7 @@ async def create_organization(payload: OrganizationCreate):
         res = supabase.table("organizations").insert({"name": payload.name}).execute()
         if not res.data:
             raise HTTPException(status_code=500, detail="Failed to create organization")
+        hierarchy.add_organization(res.data[0])
         return {"status": "success", "data": res.data[0]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -94,6 +155,7 @@ async def create_branch(payload: BranchCreate):
         res = supabase.table("branches").insert(branch_row).execute()
         if not res.data:
             raise HTTPException(status_code=500, detail="Failed to create branch")
+        hierarchy.add_branch(res.data[0])
         return {"status": "success", "data": res.data[0]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -107,6 +169,8 @@ async def create_department(payload: DepartmentCreate):
         ).execute()
         if not res.data:
             raise HTTPException(status_code=500, detail="Failed to create department")
+        hierarchy.add_department(res.data[0])
+        hot_store.register_department(res.data[0]["id"], payload.name, payload.branch_id)
         return {"status": "success", "data": res.data[0]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -115,11 +179,11 @@ async def create_department(payload: DepartmentCreate):
 @app.post("/log/manual")
 async def log_manual(data: EmissionLogCreate):
     try:
-        co2e, factor_id = calculate_co2e(data.category, data.activity, data.value)
-
         # Use provided activity_date or default to today
         activity_date = data.activity_date.isoformat() if data.activity_date else datetime.now().date().isoformat()
 
+        co2e, factor_id = calculate_co2e(data.category, data.activity, data.value, activity_date)
+
         log_entry = {
             "dept_id": int(data.dept_id),  # This is now an int
             "factor_id": int(factor_id),  # This will be an int from calculate_co2e
@@ -132,6 +196,7 @@ async def log_manual(data: EmissionLogCreate):
         res = supabase.table("carbon_logs").insert(log_entry).execute()
         if not res.data:
             raise HTTPException(status_code=500, detail="Failed to log entry")
+        live_hub.record_inserts(res.data)
         return {"status": "success", "data": res.data[0], "co2e_kg": co2e}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -144,6 +209,62 @@ async def log_csv(dept_id: str, file: UploadFile = File(...)):
     return {"status": "success", "rows_processed": count}
 
 
+@app.post("/factors/recalculate")
+async def start_factor_recalculation(payload: FactorRecalculationCreate, background_tasks: BackgroundTasks):
+    """Recompute co2e_kg for logs of a factor after a new version was added"""
+    try:
+        since = payload.since.isoformat() if payload.since else None
+        job = create_job(payload.category, payload.activity, since)
+        background_tasks.add_task(run_job, job["id"])
+        return {"status": "success", "data": job}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/factors/recalculate/{job_id}/resume")
+async def resume_factor_recalculation(job_id: int, background_tasks: BackgroundTasks):
+    """Continue a stopped or failed recalculation job from its last checkpoint"""
+    try:
+        job = claim_job(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=409, detail="Job is already running or completed")
+    background_tasks.add_task(run_job, job_id, claimed=job)
+    return {"status": "success", "data": job}
+
+
+@app.get("/factors/recalculate/{job_id}")
+async def get_factor_recalculation(job_id: int):
+    """Report progress of a recalculation job"""
+    try:
+        return {"status": "success", "data": get_job(job_id)}
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.websocket("/ws/analytics/{scope_type}/{scope_id}")
+async def analytics_updates(websocket: WebSocket, scope_type: str, scope_id: str):
+    """Push incremental period, category and department deltas for one scope as logs are written"""
+    if scope_type not in SCOPE_TYPES:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    queue = live_hub.subscribe(scope_type, scope_id)
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=30)
+            except asyncio.TimeoutError:
+                # Heartbeat so dead connections are noticed and released
+                message = {"type": "ping"}
+            await websocket.send_json(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        live_hub.unsubscribe(scope_type, scope_id, queue)
+
+
 @app.get("/analytics/org/{org_id}/total")
 async def get_org_total(org_id: str):
     """Get total emissions for an organization across all branches and departments"""
@@ -181,10 +302,20 @@ async def get_org_emissions_by_time(
 ):
     """Get emissions for an organization grouped by activity_date period"""
     try:
+        if hot_store.covers(start_date):
+            data = hot_store.sum_by_period(period, org_id=org_id, start_date=start_date, end_date=end_date)
+            formatted = [{"period_start": k, "total_emissions": v} for k, v in sorted(data.items())]
+            return {"status": "success", "data": formatted}
+
         # Query logs with activity_date and join to filter by org
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, activity_date, departments!inner(branches!inner(org_id))"
-        ).eq("departments.branches.org_id", org_id).execute()
+        ).eq("departments.branches.org_id", org_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         # Group by period
         data = {}
@@ -228,10 +359,20 @@ async def get_branch_emissions_by_time(
 ):
     """Get emissions for a branch grouped by activity_date period"""
     try:
+        if hot_store.covers(start_date):
+            data = hot_store.sum_by_period(period, branch_id=branch_id, start_date=start_date, end_date=end_date)
+            formatted = [{"period_start": k, "total_emissions": v} for k, v in sorted(data.items())]
+            return {"status": "success", "data": formatted}
+
         # Query logs with activity_date and join to filter by branch
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, activity_date, departments!inner(branch_id)"
-        ).eq("departments.branch_id", branch_id).execute()
+        ).eq("departments.branch_id", branch_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         # Group by period
         data = {}
@@ -269,13 +410,23 @@ async def get_branch_emissions_by_time(
 
 
 @app.get("/analytics/org/{org_id}/by-category")
-async def get_org_emissions_by_category(org_id: str):
+async def get_org_emissions_by_category(org_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     try:
+        if hot_store.covers(start_date):
+            data = hot_store.sum_by_category(org_id=org_id, start_date=start_date, end_date=end_date)
+            formatted = [{"category": k, "value": v} for k, v in data.items()]
+            return {"status": "success", "data": formatted}
+
         # Query logs via joins: logs -> emission_factors, logs -> departments -> branches (filter by org_id)
         # We need emission_factors for 'category'
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, emission_factors!inner(category), departments!inner(branches!inner(org_id))"
-        ).eq("departments.branches.org_id", org_id).execute()
+        ).eq("departments.branches.org_id", org_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         data = {}
         for row in res.data:
@@ -291,12 +442,22 @@ async def get_org_emissions_by_category(org_id: str):
         return {"status": "error", "message": str(e), "data": []}
 
 @app.get("/analytics/branch/{branch_id}/by-category")
-async def get_branch_emissions_by_category(branch_id: str):
+async def get_branch_emissions_by_category(branch_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     try:
+        if hot_store.covers(start_date):
+            data = hot_store.sum_by_category(branch_id=branch_id, start_date=start_date, end_date=end_date)
+            formatted = [{"category": k, "value": v} for k, v in data.items()]
+            return {"status": "success", "data": formatted}
+
         # Query: logs -> emission_factors, logs -> departments (filter by branch_id)
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, emission_factors!inner(category), departments!inner(branch_id)"
-        ).eq("departments.branch_id", branch_id).execute()
+        ).eq("departments.branch_id", branch_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         data = {}
         for row in res.data:
@@ -311,12 +472,22 @@ async def get_branch_emissions_by_category(branch_id: str):
         return {"status": "error", "message": str(e), "data": []}
 
 @app.get("/analytics/department/{dept_id}/by-category")
-async def get_department_emissions_by_category(dept_id: int):
+async def get_department_emissions_by_category(dept_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None):
     try:
+        if hot_store.covers(start_date):
+            data = hot_store.sum_by_category(dept_id=dept_id, start_date=start_date, end_date=end_date)
+            formatted = [{"category": k, "value": v} for k, v in data.items()]
+            return {"status": "success", "data": formatted}
+
         # Query: logs -> emission_factors
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, emission_factors!inner(category)"
-        ).eq("dept_id", dept_id).execute()
+        ).eq("dept_id", dept_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         data = {}
         for row in res.data:
@@ -331,13 +502,24 @@ async def get_department_emissions_by_category(dept_id: int):
 
 
 @app.get("/analytics/org/{org_id}/by-department")
-async def get_org_emissions_by_department(org_id: str):
+async def get_org_emissions_by_department(org_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get emissions for an organization grouped by department"""
     try:
+        if hot_store.covers(start_date):
+            totals = hot_store.sum_by_department(org_id=org_id, start_date=start_date, end_date=end_date)
+            formatted = [{"dept_id": str(d), "dept_name": name, "total_emissions": v} for d, name, v in totals]
+            formatted.sort(key=lambda x: x['total_emissions'], reverse=True)
+            return {"status": "success", "data": formatted}
+
         # Query logs with department info via joins
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, departments!inner(id, name, branches!inner(org_id))"
-        ).eq("departments.branches.org_id", org_id).execute()
+        ).eq("departments.branches.org_id", org_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         data = {}
         for row in res.data:
@@ -359,13 +541,24 @@ async def get_org_emissions_by_department(org_id: str):
 
 
 @app.get("/analytics/branch/{branch_id}/by-department")
-async def get_branch_emissions_by_department(branch_id: str):
+async def get_branch_emissions_by_department(branch_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get emissions for a branch grouped by department"""
     try:
+        if hot_store.covers(start_date):
+            totals = hot_store.sum_by_department(branch_id=branch_id, start_date=start_date, end_date=end_date)
+            formatted = [{"dept_id": str(d), "dept_name": name, "total_emissions": v} for d, name, v in totals]
+            formatted.sort(key=lambda x: x['total_emissions'], reverse=True)
+            return {"status": "success", "data": formatted}
+
         # Query logs with department info
-        res = supabase.table("carbon_logs").select(
+        query = supabase.table("carbon_logs").select(
             "co2e_kg, departments!inner(id, name, branch_id)"
-        ).eq("departments.branch_id", branch_id).execute()
+        ).eq("departments.branch_id", branch_id)
+        if start_date:
+            query = query.gte("activity_date", start_date)
+        if end_date:
+            query = query.lte("activity_date", end_date)
+        res = query.execute()
         
         data = {}
         for row in res.data:
@@ -385,6 +578,86 @@ async def get_branch_emissions_by_department(branch_id: str):
         print(f"Error fetching branch department emissions: {e}")
         return {"status": "error", "message": str(e), "data": []}
 
+@app.post("/analytics/compare")
+async def compare_emissions(payload: ScopeComparisonRequest):
+    """Compare many departments, branches or orgs with aligned series from one grouped query"""
+    if not payload.scope_ids:
+        raise HTTPException(status_code=400, detail="scope_ids must not be empty")
+    if payload.start_date and payload.end_date and payload.start_date > payload.end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+    try:
+        data = compare_scopes(
+            scope_type=payload.scope_type,
+            scope_ids=payload.scope_ids,
+            metrics=payload.metrics,
+            period=payload.period,
+            start_date=payload.start_date.isoformat() if payload.start_date else None,
+            end_date=payload.end_date.isoformat() if payload.end_date else None,
+            normalize_by=payload.normalize_by,
+            denominators=payload.denominators
+        )
+        return {"status": "success", "data": data}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/analytics/org/{org_id}/anomalies")
+async def get_org_anomalies(
+    org_id: str,
+    start_date: Optional[str] = Query(None, pattern="^\\d{4}-\\d{2}-\\d{2}$"),
+    end_date: Optional[str] = Query(None, pattern="^\\d{4}-\\d{2}-\\d{2}$"),
+    window: int = Query(28, ge=2, le=365, description="Baseline length (days, or weeks for seasonal; seasonal is capped at ANOMALY_SEASONAL_MAX_WEEKS)"),
+    threshold: float = Query(3.0, gt=0, description="z-score above which a cell is flagged"),
+    method: str = Query("rolling", pattern="^(rolling|seasonal)$"),
+    limit: int = Query(100, ge=1, le=5000)
+):
+    """Flag department/day/category cells whose emissions jumped above their baseline"""
+    try:
+        hotspots = detect_anomalies(
+            org_id=org_id,
+            start_date=start_date,
+            end_date=end_date,
+            window=window,
+            threshold=threshold,
+            method=method,
+            limit=limit
+        )
+        return {"status": "success", "data": hotspots}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/precompute/run")
+async def trigger_precompute():
+    """Start a precompute pass now instead of waiting for the off-peak window"""
+    app.state.precompute_run = asyncio.create_task(scheduler.run_once(), name="precompute-run")
+    app.state.precompute_run.add_done_callback(_log_task_failure)
+    return {"status": "success", "data": {"started": True}}
+
+
+@app.get("/precompute/status")
+async def get_precompute_status():
+    return {"status": "success", "data": scheduler.last_run}
+
+
+@app.get("/analytics/{scope_type}/{scope_id}/summary")
+async def get_scope_summary(scope_type: str, scope_id: str):
+    """Precomputed dashboard aggregates for a scope, computed live if missing or stale"""
+    if scope_type not in SCOPE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown scope type: {scope_type}")
+    try:
+        row = scheduler.get_fresh(scope_type, scope_id)
+    except Exception as e:
+        print(f"Error reading precomputed aggregates: {e}")
+        row = None
+    if row:
+        return {"status": "success", "data": row["aggregates"], "computed_at": row["computed_at"]}
+    try:
+        return {"status": "success", "data": scheduler.aggregates(scope_type, scope_id), "computed_at": None}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/recommendations")
 async def get_recommendations(
     org_id: Optional[str] = Query(None, description="Organization ID"),
@@ -399,7 +672,8 @@ async def get_recommendations(
         None,
         description="End date (YYYY-MM-DD)",
         pattern="^\\d{4}-\\d{2}-\\d{2}$"
-    )
+    ),
+    include_hotspots: bool = Query(True, description="Feed detected emission anomalies into the prompt")
 ):
     """
     Get AI-powered recommendations for reducing carbon emissions
@@ -426,6 +700,50 @@ async def get_recommendations(
                 detail="Invalid date format. Use YYYY-MM-DD"
             )
     
+    # Serve the off-peak precomputation when it covers this request and no logs arrived since
+    if not start_date and not end_date and include_hotspots:
+        if dept_id:
+            scope = ("department", str(dept_id))
+        elif branch_id:
+            scope = ("branch", branch_id)
+        else:
+            scope = ("org", org_id)
+        try:
+            row = scheduler.get_fresh(*scope)
+        except Exception as e:
+            print(f"Error reading precomputed recommendations: {e}")
+            row = None
+        if row:
+            return {
+                "status": "success",
+                "data": {
+                    "recommendations": row["recommendations"],
+                    "context": {
+                        "org_id": org_id,
+                        "branch_id": branch_id,
+                        "dept_id": dept_id,
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "hotspots": row.get("hotspots") or [],
+                        "computed_at": row["computed_at"]
+                    }
+                }
+            }
+
+    hotspots = []
+    if include_hotspots:
+        try:
+            hotspots = detect_anomalies(
+                org_id=org_id,
+                branch_id=branch_id,
+                dept_id=dept_id,
+                start_date=start_date,
+                end_date=end_date,
+                limit=5
+            )
+        except Exception as e:
+            print(f"Error detecting hotspots: {e}")
+
     try:
         engine = RecommendationEngine()
         recommendations = engine.generate_recommendations(
@@ -433,7 +751,8 @@ async def get_recommendations(
             branch_id=branch_id,
             dept_id=dept_id,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            hotspots=hotspots
         )
         
         return {
@@ -445,7 +764,8 @@ async def get_recommendations(
                     "branch_id": branch_id,
                     "dept_id": dept_id,
                     "start_date": start_date,
-                    "end_date": end_date
+                    "end_date": end_date,
+                    "hotspots": hotspots
                 }
             }
         }
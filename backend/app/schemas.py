@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 from datetime import date
 
 from pydantic import BaseModel
@@ -24,4 +24,21 @@ class EmissionLogCreate(BaseModel):
     activity: str  # e.g., "Grid"
     value: float  # e.g., 500
     entry_type: str = "manual"
-    activity_date: Optional[date] = None  # Date of the activity, defaults to today if not provided
\ No newline at end of file
+    activity_date: Optional[date] = None  # Date of the activity, defaults to today if not provided
+
+
+class FactorRecalculationCreate(BaseModel):
+    category: str  # e.g., "Energy"
+    activity: str  # e.g., "Grid Electricity"
+    since: Optional[date] = None  # Only recompute logs on or after this date
+
+
+class ScopeComparisonRequest(BaseModel):
+    scope_type: Literal["department", "branch", "org"] = "branch"
+    scope_ids: List[str]
+    metrics: List[Literal["total", "time_series", "categories"]] = ["total", "time_series", "categories"]
+    period: Literal["day", "week", "month", "year"] = "month"
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    normalize_by: Optional[Literal["headcount", "floor_area"]] = None  # Numeric column on the scope table
+    denominators: Optional[Dict[str, float]] = None  # Per-scope override, e.g. {"<branch_id>": 1200}
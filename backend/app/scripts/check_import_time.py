@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+from app.services.warmup import IMPORT_TIME_BUDGET_MS
+
+# Import in a fresh interpreter so nothing is already cached in sys.modules
+PROBE = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+
+
+def run_check():
+    out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True)
+    if out.returncode != 0:
+        print(out.stderr)
+        return 1
+    elapsed = float(out.stdout.strip().splitlines()[-1])
+    print(f"app.main imported in {elapsed:.0f} ms (budget {IMPORT_TIME_BUDGET_MS:.0f} ms)")
+    return 0 if elapsed <= IMPORT_TIME_BUDGET_MS else 1
+
+if __name__ == "__main__":
+    sys.exit(run_check())
@@ -1,4 +1,20 @@
+import sys
+from datetime import date
+
 from app.database import supabase
+from app.services.recalculator import create_job, run_job
+from app.services.rollup import fetch_all
+
+# Factors are versioned: each row is valid from `valid_from` until `valid_to`
+# (NULL = current). Requires sql/migrate_schema.sql: the unique constraint on
+# (category, activity, valid_from) and publish_factor_version(), which adds a
+# version and closes the one it supersedes in a single transaction.
+# When a published factor changes (e.g. the annual CEA or DEFRA update), add the new
+# value with a later `valid_from` rather than editing the old one in place.
+# New factors start at DEFAULT_VALID_FROM; a changed value without an explicit
+# `valid_from` takes effect today, so history keeps the old version. Give the
+# old version's `valid_from` explicitly to correct it in place instead.
+DEFAULT_VALID_FROM = "2000-01-01"
 
 OFFICIAL_FACTORS = [
   
@@ -17,14 +33,61 @@ OFFICIAL_FACTORS = [
     {"category": "Travel", "activity": "Long-haul Flight", "factor": 0.19, "unit": "km", "source": "ICAO"}
 ]
 
-def run_seed():
+def run_seed(recalculate: bool = True):
+    """
+    Insert new factor versions, close the versions they supersede and queue a
+    recalculation job for every factor whose value changed.
+    """
     print(f"Seeding {len(OFFICIAL_FACTORS)} standard factors...")
     try:
-        # Using upsert requires a unique constraint on (category, activity) in Supabase
-        supabase.table("emission_factors").upsert(OFFICIAL_FACTORS, on_conflict="category,activity").execute()
-        print("Seeding successful.")
+        existing = fetch_all(lambda: supabase.table("emission_factors")
+                             .select("id, category, activity, factor, valid_from, valid_to").order("id"))
+        current = {(r['category'], r['activity']): r for r in existing if not r.get('valid_to')}
+
+        rows = []
+        for factor in OFFICIAL_FACTORS:
+            key = (factor['category'], factor['activity'])
+            old = current.get(key)
+            if old and float(old['factor']) == float(factor['factor']):
+                continue
+            default_from = date.today().isoformat() if old else DEFAULT_VALID_FROM
+            row = {**factor, "valid_from": factor.get("valid_from", default_from)}
+            if old:
+                old_from = old.get('valid_from') or DEFAULT_VALID_FROM
+                if old_from > row['valid_from']:
+                    print(f"Skipping {key}: a newer version from {old_from} already exists")
+                    continue
+            rows.append((row, old is not None))
+    except Exception as e:
+        print(f"Error seeding: {e}")
+        return []
+
+    # Each version is published atomically; on failure, still queue jobs for those already published
+    changed = []
+    try:
+        for row, is_change in rows:
+            supabase.rpc("publish_factor_version", {
+                "p_category": row['category'],
+                "p_activity": row['activity'],
+                "p_factor": row['factor'],
+                "p_unit": row.get('unit'),
+                "p_source": row.get('source'),
+                "p_valid_from": row['valid_from'],
+            }).execute()
+            if is_change:
+                changed.append(((row['category'], row['activity']), row['valid_from']))
+        print(f"Seeding successful: {len(rows)} new or corrected versions.")
     except Exception as e:
         print(f"Error seeding: {e}")
 
+    jobs = []
+    for (category, activity), valid_from in changed:
+        job = create_job(category, activity, since=valid_from)
+        print(f"Queued recalculation job {job['id']} for {category} - {activity} from {valid_from}")
+        jobs.append(job)
+        if recalculate:
+            run_job(job['id'])
+    return jobs
+
 if __name__ == "__main__":
-    run_seed()
\ No newline at end of file
+    run_seed(recalculate="--no-recalculate" not in sys.argv)
@@ -0,0 +1,179 @@
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app.services.rollup import fetch_rollup
+
+# Days scored when no start_date is given; history before that only seeds baselines
+DEFAULT_DAYS = int(os.environ.get("ANOMALY_DEFAULT_DAYS", "90"))
+# Longest seasonal baseline in weeks, which bounds the history fetched and held per request
+SEASONAL_MAX_WEEKS = int(os.environ.get("ANOMALY_SEASONAL_MAX_WEEKS", "52"))
+# Matrix cells (departments x categories x days) scored at once; larger scopes are scored
+# a block of departments at a time so peak memory stays around 10 arrays of this size
+MAX_CELLS = int(os.environ.get("ANOMALY_MAX_CELLS", "2000000"))
+
+
+def _fetch_daily_totals(org_id: str = None, branch_id: str = None, dept_id: int = None,
+                        start_date: str = None, end_date: str = None):
+    """
+    Daily co2e_kg per (department, category) for the scope, grouped in Postgres
+    """
+    if dept_id:
+        scope = ("department", dept_id)
+    elif branch_id:
+        scope = ("branch", branch_id)
+    else:
+        scope = ("org", org_id)
+    return fetch_rollup(scope[0], [scope[1]], period="day", start_date=start_date,
+                        end_date=end_date, by_department=True)
+
+
+def build_emission_matrix(rows, start_date: str, end_date: str):
+    """
+    Build a departments x categories x days matrix of co2e_kg from daily rollup rows.
+
+    Returns (matrix, dept_ids, dept_names, categories, start_day).
+    """
+    first = date.fromisoformat(start_date)
+    n_days = (date.fromisoformat(end_date) - first).days + 1
+    rows = [r for r in rows if r.get('period_start') and r.get('dept_id') is not None]
+    if not rows or n_days <= 0:
+        return np.zeros((0, 0, 0)), np.array([], dtype=np.int64), {}, np.array([]), first
+
+    dept_names = {int(r['dept_id']): r.get('dept_name') or 'Unknown' for r in rows}
+    day_idx = (np.array([str(r['period_start'])[:10] for r in rows], dtype='datetime64[D]')
+               - np.datetime64(first, 'D')).astype(np.int64)
+    unique_depts, dept_index = np.unique(np.array([int(r['dept_id']) for r in rows], dtype=np.int64),
+                                         return_inverse=True)
+    unique_categories, category_index = np.unique(
+        np.array([r.get('category') or 'Unknown' for r in rows], dtype=object), return_inverse=True)
+    values = np.array([float(r['total_co2e_kg'] or 0) for r in rows])
+
+    in_range = (day_idx >= 0) & (day_idx < n_days)
+    matrix = np.zeros((len(unique_depts), len(unique_categories), n_days))
+    np.add.at(matrix, (dept_index[in_range], category_index[in_range], day_idx[in_range]), values[in_range])
+    return matrix, unique_depts, dept_names, unique_categories, first
+
+
+def _trailing_stats(series: np.ndarray, window: int, observed: np.ndarray = None):
+    """
+    Mean, std and number of observations among the `window` cells preceding each
+    cell on the last axis. Cells where `observed` is False are left out of the
+    baseline instead of counting as zero.
+    """
+    if observed is None:
+        observed = np.ones(series.shape, dtype=bool)
+    pad = np.zeros(series.shape[:-1] + (1,))
+    values = np.where(observed, series, 0.0)
+    n = np.cumsum(np.concatenate([pad, observed.astype(float)], axis=-1), axis=-1)
+    s1 = np.cumsum(np.concatenate([pad, values], axis=-1), axis=-1)
+    s2 = np.cumsum(np.concatenate([pad, values ** 2], axis=-1), axis=-1)
+
+    t = np.arange(series.shape[-1])
+    lo = np.maximum(t - window, 0)
+
+    count = n[..., t] - n[..., lo]
+    sum1 = s1[..., t] - s1[..., lo]
+    sum2 = s2[..., t] - s2[..., lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, sum1 / count, 0.0)
+        var = np.where(count > 0, sum2 / count - mean ** 2, 0.0)
+    return mean, np.sqrt(np.maximum(var, 0.0)), count
+
+
+def score_matrix(matrix: np.ndarray, window: int = 28, method: str = "rolling", observed: np.ndarray = None):
+    """
+    Compute baselines and z-scores for every cell of the matrix at once.
+
+    "rolling" compares each day against the preceding `window` days; "seasonal"
+    compares it against the same weekday over the preceding `window` weeks.
+    Logging is sparse (bills, trips), so by default only days with emissions
+    feed the baselines and `count` is the number of such days.
+    """
+    if observed is None:
+        observed = matrix != 0
+    if method == "seasonal":
+        mean = np.zeros_like(matrix)
+        std = np.zeros_like(matrix)
+        count = np.zeros_like(matrix)
+        for offset in range(7):
+            m, s, c = _trailing_stats(matrix[..., offset::7], window, observed[..., offset::7])
+            mean[..., offset::7] = m
+            std[..., offset::7] = s
+            count[..., offset::7] = c
+    else:
+        mean, std, count = _trailing_stats(matrix, window, observed)
+
+    # Guard flat baselines so a jump from a constant series still scores finitely
+    floor = np.maximum(np.abs(mean) * 0.1, 1e-6)
+    z = (matrix - mean) / np.maximum(std, floor)
+    return mean, z, count
+
+
+def _score_block(rows, fetch_start: str, end_date: str, window: int, threshold: float,
+                 method: str, min_periods: int, lookback: int, limit: int):
+    """Flagged cells of one block of departments, strongest first"""
+    matrix, dept_ids, dept_names, categories, first_day = build_emission_matrix(rows, fetch_start, end_date)
+    if matrix.size == 0:
+        return []
+
+    baseline, z, count = score_matrix(matrix, window, method)
+    flagged = (z >= threshold) & (count >= min_periods) & (matrix > 0)
+    flagged[..., :lookback] = False
+
+    d_idx, c_idx, t_idx = np.nonzero(flagged)
+    order = np.argsort(-z[d_idx, c_idx, t_idx])[:limit]
+
+    results = []
+    for i in order:
+        d, c, t = d_idx[i], c_idx[i], t_idx[i]
+        dept = int(dept_ids[d])
+        results.append({
+            "dept_id": dept,
+            "dept_name": dept_names.get(dept, 'Unknown'),
+            "category": str(categories[c]),
+            "period": (first_day + timedelta(days=int(t))).isoformat(),
+            "co2e_kg": float(matrix[d, c, t]),
+            "baseline_kg": float(baseline[d, c, t]),
+            "z_score": float(z[d, c, t]),
+        })
+    return results
+
+
+def detect_anomalies(org_id: str = None, branch_id: str = None, dept_id: int = None,
+                     start_date: str = None, end_date: str = None, window: int = 28,
+                     threshold: float = 3.0, method: str = "rolling", min_periods: int = 7,
+                     limit: int = 100):
+    """
+    Flag (department, day, category) cells whose emissions deviate from their baseline
+    """
+    if method == "seasonal":
+        window = min(window, SEASONAL_MAX_WEEKS)
+    # Score a bounded window (the last DEFAULT_DAYS by default) plus enough
+    # history before it to seed the first baselines
+    end_date = end_date or date.today().isoformat()
+    if not start_date:
+        start_date = (date.fromisoformat(end_date) - timedelta(days=DEFAULT_DAYS - 1)).isoformat()
+    lookback = window * 7 if method == "seasonal" else window
+    fetch_start = (datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=lookback)).date().isoformat()
+
+    rows = [r for r in _fetch_daily_totals(org_id, branch_id, dept_id, fetch_start, end_date)
+            if r.get('dept_id') is not None]
+    if not rows:
+        return []
+
+    n_days = (date.fromisoformat(end_date) - date.fromisoformat(fetch_start)).days + 1
+    n_categories = len({r.get('category') or 'Unknown' for r in rows})
+    row_depts = np.array([int(r['dept_id']) for r in rows], dtype=np.int64)
+    depts = np.unique(row_depts)
+    block = max(1, MAX_CELLS // max(n_categories * n_days, 1))
+
+    results = []
+    for i in range(0, len(depts), block):
+        in_block = np.isin(row_depts, depts[i:i + block])
+        block_rows = [r for r, keep in zip(rows, in_block) if keep]
+        results += _score_block(block_rows, fetch_start, end_date, window, threshold,
+                                method, min_periods, lookback, limit)
+    results.sort(key=lambda r: -r['z_score'])
+    return results[:limit]
@@ -1,20 +1,105 @@
+import os
+import time
+from datetime import date
+
 from app.database import supabase
+from app.services.rollup import fetch_all
+
+# (category, activity) -> versions sorted by valid_from, each
+# {"id", "factor", "valid_from", "valid_to"}; filled by load_factor_cache() or on first lookup.
+# Reloads build new dicts and rebind these names, so readers never see a half-filled cache.
+_factor_cache = {}
+_factor_categories = {}  # factor version id -> category
+_loaded_at = 0.0
+
+# The whole cache is reloaded after this long so versions added by run_seed or
+# another instance are picked up; recalculation jobs wait this long before
+# their final sweep (see recalculator.run_job)
+FACTOR_CACHE_TTL_SECONDS = float(os.environ.get("FACTOR_CACHE_TTL_SECONDS", "60"))
+
+
+def _build_cache(rows):
+    cache, categories = {}, {}
+    for row in rows:
+        cache.setdefault((row['category'], row['activity']), []).append({
+            "id": int(row['id']),
+            "factor": float(row['factor']),
+            "valid_from": row.get('valid_from') or "0001-01-01",
+            "valid_to": row.get('valid_to'),
+        })
+        categories[int(row['id'])] = row['category']
+    for versions in cache.values():
+        versions.sort(key=lambda v: v['valid_from'])
+    return cache, categories
+
+
+def load_factor_cache():
+    global _factor_cache, _factor_categories, _loaded_at
+    rows = fetch_all(lambda: supabase.table("emission_factors")
+                     .select("id, category, activity, factor, valid_from, valid_to").order("id"))
+    _factor_cache, _factor_categories = _build_cache(rows)
+    _loaded_at = time.monotonic()
+    return len(_factor_cache)
+
+
+def _refresh_if_expired():
+    global _loaded_at
+    if _loaded_at and time.monotonic() - _loaded_at <= FACTOR_CACHE_TTL_SECONDS:
+        return
+    try:
+        load_factor_cache()
+    except Exception as e:
+        # Keep resolving from the stale cache (or per-key lookups) and retry after another TTL
+        print(f"Error reloading emission factors: {e}")
+        _loaded_at = time.monotonic()
+
+
+def get_factor_versions(category: str, activity: str):
+    """All versions of a factor, oldest first"""
+    _refresh_if_expired()
+    versions = _factor_cache.get((category, activity))
+    if versions:
+        return versions
 
-def calculate_co2e(category: str, activity: str, value: float):
     # Fetch the standard factor from our seeded table
     res = supabase.table("emission_factors") \
-        .select("id, factor") \
+        .select("id, category, activity, factor, valid_from, valid_to") \
         .eq("category", category) \
         .eq("activity", activity) \
-        .single().execute()
+        .execute()
     
     if not res.data:
         raise ValueError(f"No factor found for {category} - {activity}")
     
-    factor = float(res.data['factor'])
-    factor_id = int(res.data['id'])  # Ensure this is an int for int8
+    # Replace the entry whole rather than appending, so concurrent misses cannot duplicate versions
+    cache, categories = _build_cache(res.data)
+    _factor_categories.update(categories)
+    _factor_cache[(category, activity)] = cache[(category, activity)]
+    return cache[(category, activity)]
+
+
+def category_for_factor(factor_id: int):
+    """Category of a cached factor version, or None if it has not been loaded"""
+    return _factor_categories.get(int(factor_id))
+
+
+def resolve_factor(category: str, activity: str, activity_date: str = None):
+    """Pick the factor version in effect on activity_date (YYYY-MM-DD, defaults to today)"""
+    day = (activity_date or date.today().isoformat())[:10]
+    versions = get_factor_versions(category, activity)
+    chosen = versions[0]  # dates before the first version fall back to the earliest factor
+    for version in versions:
+        if version['valid_from'] <= day:
+            chosen = version
+    return chosen
+
+
+def calculate_co2e(category: str, activity: str, value: float, activity_date: str = None):
+    version = resolve_factor(category, activity, activity_date)
+    factor = version['factor']
+    factor_id = version['id']  # Ensure this is an int for int8
     
     # Calculation: Value * Factor
     co2e_kg = float(value * factor)  # Explicit float conversion
     
-    return co2e_kg, factor_id
\ No newline at end of file
+    return co2e_kg, factor_id
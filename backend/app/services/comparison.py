@@ -0,0 +1,109 @@
+import numpy as np
+
+from app.database import supabase
+from app.services.hierarchy import hierarchy
+from app.services.hot_store import bucket_days
+from app.services.rollup import fetch_rollup
+
+# scope_type -> (carbon_logs filter column, scope table)
+SCOPES = {
+    "department": ("dept_id", "departments"),
+    "branch": ("departments.branch_id", "branches"),
+    "org": ("departments.branches.org_id", "organizations"),
+}
+
+# Per-scope columns that compare_scopes may divide by (added by sql/migrate_schema.sql)
+NORMALIZE_COLUMNS = ("headcount", "floor_area")
+
+
+def _scope_name(scope_type: str, scope_id: str):
+    if not hierarchy.loaded:
+        return None
+    if scope_type == "department":
+        return (hierarchy.departments.get(int(scope_id)) or {}).get('name')
+    if scope_type == "branch":
+        return (hierarchy.branches.get(scope_id) or {}).get('name')
+    return hierarchy.organizations.get(scope_id)
+
+
+def _load_denominators(scope_type: str, scope_ids, column: str):
+    """Read a numeric per-scope column such as headcount or floor area"""
+    if column not in NORMALIZE_COLUMNS:
+        raise ValueError(f"Invalid normalisation column: {column}")
+    table = SCOPES[scope_type][1]
+    res = supabase.table(table).select(f"id, {column}").in_("id", list(scope_ids)).execute()
+    return {str(r['id']): r.get(column) for r in res.data or []}
+
+
+def compare_scopes(scope_type: str, scope_ids, metrics=("total", "time_series", "categories"),
+                   period: str = "month", start_date: str = None, end_date: str = None,
+                   normalize_by: str = None, denominators: dict = None):
+    """
+    Aligned totals, time series and category breakdowns for many scopes from one grouped query
+    """
+    if scope_type not in SCOPES:
+        raise ValueError(f"Unknown scope type: {scope_type}")
+    if normalize_by and normalize_by not in NORMALIZE_COLUMNS:
+        raise ValueError(f"Invalid normalisation column: {normalize_by}")
+    scope_ids = [str(s) for s in dict.fromkeys(scope_ids)]
+
+    # Postgres returns one row per (scope, period, category)
+    rows = [r for r in fetch_rollup(scope_type, scope_ids, period=period, start_date=start_date,
+                                    end_date=end_date) if r.get('period_start')]
+
+    scope_pos = {s: i for i, s in enumerate(scope_ids)}
+    scope_idx = np.array([scope_pos.get(str(r['scope_id']), -1) for r in rows], dtype=np.int64)
+    keep = scope_idx >= 0
+    rows = [r for r, k in zip(rows, keep) if k]
+    scope_idx = scope_idx[keep]
+
+    co2e = np.array([float(r['total_co2e_kg'] or 0) for r in rows])
+    days = np.array([str(r['period_start'])[:10] for r in rows], dtype='datetime64[D]')
+    periods, period_idx = np.unique(bucket_days(days, period), return_inverse=True)
+    categories, category_idx = np.unique(
+        np.array([r.get('category') or 'Unknown' for r in rows], dtype=object),
+        return_inverse=True,
+    )
+
+    n_scopes, n_periods, n_categories = len(scope_ids), len(periods), len(categories)
+    by_period = np.bincount(scope_idx * n_periods + period_idx, weights=co2e,
+                            minlength=n_scopes * n_periods).reshape(n_scopes, n_periods)
+    by_category = np.bincount(scope_idx * n_categories + category_idx, weights=co2e,
+                              minlength=n_scopes * n_categories).reshape(n_scopes, n_categories)
+    totals = by_period.sum(axis=1)
+
+    scale = np.ones(n_scopes)
+    denoms = {}
+    if normalize_by:
+        denoms.update(_load_denominators(scope_type, scope_ids, normalize_by))
+    if denominators:
+        denoms.update({str(k): v for k, v in denominators.items()})
+    if denoms:
+        raw = np.array([float(denoms.get(s) or 0) for s in scope_ids])
+        # Scopes without a usable denominator are reported as null rather than divided by zero
+        scale = np.where(raw > 0, 1.0 / np.where(raw > 0, raw, 1.0), np.nan)
+
+    def _values(arr):
+        return [None if np.isnan(v) else float(v) for v in arr]
+
+    results = []
+    for i, scope_id in enumerate(scope_ids):
+        entry = {"scope_id": scope_id, "name": _scope_name(scope_type, scope_id)}
+        if denoms:
+            entry["denominator"] = denoms.get(scope_id)
+        if "total" in metrics:
+            entry["total_emissions"] = _values([totals[i] * scale[i]])[0]
+        if "time_series" in metrics:
+            entry["time_series"] = _values(by_period[i] * scale[i])
+        if "categories" in metrics:
+            entry["categories"] = dict(zip((str(c) for c in categories), _values(by_category[i] * scale[i])))
+        results.append(entry)
+
+    return {
+        "scope_type": scope_type,
+        "period": period,
+        "normalized": bool(denoms),
+        "periods": [str(p) for p in periods],
+        "categories": [str(c) for c in categories],
+        "scopes": results,
+    }
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+from app.database import supabase
+from app.services.rollup import fetch_all
+
+# Reload the whole tree after this long, so orgs/branches/departments created
+# through other instances are picked up
+HIERARCHY_TTL_SECONDS = float(os.environ.get("HIERARCHY_TTL_SECONDS", "300"))
+
+
+class HierarchyCache:
+    """
+    In-memory copy of the organization -> branch -> department tree.
+
+    Loaded during warm-up and used to resolve a department's branch/org and to
+    walk the tree for background work. Create endpoints update it in place;
+    entries made on other instances arrive via ensure_department() on a miss
+    or the next TTL reload in ensure_fresh(). List endpoints read Supabase.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.organizations = {}  # org_id -> name
+        self.branches = {}  # branch_id -> {"name", "org_id"}
+        self.departments = {}  # dept_id -> {"name", "branch_id"}
+
+    def load(self):
+        orgs = fetch_all(lambda: supabase.table("organizations").select("id, name").order("id"))
+        branches = fetch_all(lambda: supabase.table("branches").select("id, name, org_id").order("id"))
+        depts = fetch_all(lambda: supabase.table("departments").select("id, name, branch_id").order("id"))
+        with self._lock:
+            self.organizations = {str(r['id']): r['name'] for r in orgs}
+            self.branches = {str(r['id']): {"name": r['name'], "org_id": str(r['org_id'])} for r in branches}
+            self.departments = {int(r['id']): {"name": r['name'], "branch_id": str(r['branch_id'])} for r in depts}
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+        return len(self.departments)
+
+    def ensure_fresh(self):
+        """Load the tree if it was never loaded or is older than HIERARCHY_TTL_SECONDS"""
+        if not self.loaded or time.monotonic() - self.loaded_at > HIERARCHY_TTL_SECONDS:
+            self.load()
+
+    def add_organization(self, row: dict):
+        with self._lock:
+            self.organizations[str(row['id'])] = row['name']
+
+    def add_branch(self, row: dict):
+        with self._lock:
+            self.branches[str(row['id'])] = {"name": row['name'], "org_id": str(row['org_id'])}
+
+    def add_department(self, row: dict):
+        with self._lock:
+            self.departments[int(row['id'])] = {"name": row['name'], "branch_id": str(row['branch_id'])}
+
+    def ensure_department(self, dept_id: int):
+        """Fetch a department (and its branch) that was created elsewhere since load()"""
+        if int(dept_id) in self.departments:
+            return
+        res = supabase.table("departments").select("id, name, branch_id, branches!inner(id, name, org_id)") \
+            .eq("id", dept_id).execute()
+        for row in res.data or []:
+            self.add_branch(row['branches'])
+            self.add_department(row)
+
+    def list_branches(self, org_id: str):
+        return [{"id": k, "name": v['name']} for k, v in self.branches.items() if v['org_id'] == str(org_id)]
+
+    def list_departments(self, branch_id: str):
+        return [{"id": k, "name": v['name']} for k, v in self.departments.items() if v['branch_id'] == str(branch_id)]
+
+    def dept_scope(self, dept_id: int):
+        """Return (branch_id, org_id) for a department, or (None, None) if unknown"""
+        dept = self.departments.get(int(dept_id))
+        if not dept:
+            return None, None
+        branch = self.branches.get(dept['branch_id'], {})
+        return dept['branch_id'], branch.get('org_id')
+
+
+hierarchy = HierarchyCache()
@@ -0,0 +1,311 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app.database import supabase
+from app.services.rollup import fetch_all
+
+# Bytes per stored row: dept code, factor code, day number (int32) + value, co2e_kg (float64)
+ROW_BYTES = 4 + 4 + 4 + 8 + 8
+PAGE_SIZE = 1000
+
+
+def _to_day(activity_date) -> int:
+    """Convert 'YYYY-MM-DD' (or an ISO timestamp) to days since 1970-01-01"""
+    return int(np.datetime64(str(activity_date).split('T')[0], 'D').astype(np.int64))
+
+
+def bucket_days(days: np.ndarray, period: str = "month") -> np.ndarray:
+    """Truncate datetime64[D] values to the start of their day/week/month/year"""
+    if period == "day":
+        return days
+    if period == "week":
+        # 1970-01-01 was a Thursday; shift back to Monday
+        return days - ((days.astype(np.int64) + 3) % 7)
+    if period == "year":
+        return days.astype('datetime64[Y]').astype('datetime64[D]')
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+
+class HotStore:
+    """
+    In-process columnar copy of recent carbon_logs.
+
+    Rows are held in typed NumPy arrays with departments and emission factors
+    dictionary-encoded to small integer codes, so analytics group-bys become
+    masked array reductions instead of re-downloading nested JSON rows.
+
+    The store only learns of inserts through append(). With several instances,
+    run the Supabase Realtime relay (LIVE_UPDATES_REALTIME) so every instance
+    appends every insert; without it the store is only correct on a single instance.
+    """
+
+    def __init__(self, window_days: int = 365, max_bytes: int = 64 * 1024 * 1024):
+        self.window_days = window_days
+        self.max_bytes = max_bytes
+        self.ready = False
+        self.min_day = None
+        self._oldest_day = None  # earliest activity_date of any log, held or not
+        self._lock = threading.Lock()
+
+        self._size = 0
+        self._dept = np.zeros(0, dtype=np.int32)
+        self._factor = np.zeros(0, dtype=np.int32)
+        self._day = np.zeros(0, dtype=np.int32)
+        self._value = np.zeros(0, dtype=np.float64)
+        self._co2e = np.zeros(0, dtype=np.float64)
+
+        # Dimension dictionaries: external id -> code, plus per-code attributes
+        self._dept_index = {}
+        self._dept_ids = []
+        self._dept_names = []
+        self._dept_branch = []
+        self._branch_index = {}
+        self._branch_org = []
+        self._org_index = {}
+        self._factor_index = {}
+        self._factor_category = []
+        self._category_index = {}
+        self._categories = []
+
+    # ---- dimensions -------------------------------------------------------
+
+    def _code(self, index: dict, key) -> int:
+        if key not in index:
+            index[key] = len(index)
+        return index[key]
+
+    def _register_department(self, dept_id: int, name: str, branch_id: str, org_id: str):
+        branch_code = self._code(self._branch_index, str(branch_id))
+        if branch_code == len(self._branch_org):
+            self._branch_org.append(self._code(self._org_index, str(org_id)))
+        if dept_id in self._dept_index:
+            code = self._dept_index[dept_id]
+            self._dept_names[code] = name
+            self._dept_branch[code] = branch_code
+            return code
+        code = self._code(self._dept_index, dept_id)
+        self._dept_ids.append(dept_id)
+        self._dept_names.append(name)
+        self._dept_branch.append(branch_code)
+        return code
+
+    def _register_factor(self, factor_id: int, category: str):
+        if factor_id in self._factor_index:
+            return self._factor_index[factor_id]
+        code = self._code(self._factor_index, factor_id)
+        self._factor_category.append(self._code(self._category_index, category))
+        if len(self._categories) < len(self._category_index):
+            self._categories.append(category)
+        return code
+
+    def _load_dimensions(self):
+        depts = fetch_all(lambda: supabase.table("departments")
+                          .select("id, name, branch_id, branches!inner(org_id)").order("id"))
+        factors = fetch_all(lambda: supabase.table("emission_factors").select("id, category").order("id"))
+        with self._lock:
+            for row in depts:
+                org_id = (row.get('branches') or {}).get('org_id')
+                self._register_department(int(row['id']), row.get('name', 'Unknown'), row['branch_id'], org_id)
+            for row in factors:
+                self._register_factor(int(row['id']), row.get('category', 'Unknown'))
+
+    def register_department(self, dept_id: int, name: str, branch_id: str):
+        """Add a newly created department to the hierarchy dictionaries"""
+        if not self.ready:
+            return
+        try:
+            res = supabase.table("branches").select("org_id").eq("id", branch_id).single().execute()
+            with self._lock:
+                self._register_department(int(dept_id), name, branch_id, (res.data or {}).get('org_id'))
+        except Exception as e:
+            print(f"Hot store department registration failed: {e}")
+
+    def _ensure_dimensions(self, rows):
+        """Look up any departments or factors not seen since warm-up"""
+        missing_depts = {int(r['dept_id']) for r in rows} - set(self._dept_index)
+        missing_factors = {int(r['factor_id']) for r in rows} - set(self._factor_index)
+        if missing_depts:
+            res = supabase.table("departments").select("id, name, branch_id, branches!inner(org_id)") \
+                .in_("id", list(missing_depts)).execute()
+            with self._lock:
+                for row in res.data or []:
+                    org_id = (row.get('branches') or {}).get('org_id')
+                    self._register_department(int(row['id']), row.get('name', 'Unknown'), row['branch_id'], org_id)
+        if missing_factors:
+            res = supabase.table("emission_factors").select("id, category") \
+                .in_("id", list(missing_factors)).execute()
+            with self._lock:
+                for row in res.data or []:
+                    self._register_factor(int(row['id']), row.get('category', 'Unknown'))
+
+    # ---- storage ----------------------------------------------------------
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed <= len(self._day):
+            return
+        capacity = max(needed, 2 * len(self._day), 1024)
+        for name in ("_dept", "_factor", "_day", "_value", "_co2e"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _compact(self, keep: np.ndarray):
+        n = int(keep.sum())
+        for name in ("_dept", "_factor", "_day", "_value", "_co2e"):
+            arr = getattr(self, name)
+            arr[:n] = arr[:self._size][keep]
+        self._size = n
+
+    def _evict(self):
+        """Drop rows outside the date window, then oldest days until within the memory budget"""
+        cutoff = _to_day(datetime.now().date()) - self.window_days
+        budget_rows = self.max_bytes // ROW_BYTES
+        if self._size > budget_rows:
+            days = self._day[:self._size]
+            # Rows newer than the k-th oldest day are at most budget_rows
+            k = self._size - budget_rows - 1
+            budget_cutoff = int(np.partition(days, k)[k]) + 1
+            newest = int(days.max())
+            if budget_cutoff > newest:
+                # The newest day alone exceeds the budget; keep it rather than emptying the store
+                print(f"Hot store: one day holds more rows than HOT_STORE_MAX_MB allows ({self.max_bytes} bytes)")
+                budget_cutoff = newest
+            cutoff = max(cutoff, budget_cutoff)
+        if self.min_day is None or cutoff > self.min_day:
+            self.min_day = cutoff
+            if self._size:
+                self._compact(self._day[:self._size] >= cutoff)
+
+    def _append_rows(self, rows):
+        if rows:
+            oldest = min(_to_day(r['activity_date']) for r in rows)
+            self._oldest_day = oldest if self._oldest_day is None else min(self._oldest_day, oldest)
+        rows = [r for r in rows if int(r['dept_id']) in self._dept_index and int(r['factor_id']) in self._factor_index]
+        if not rows:
+            return
+        days = np.array([_to_day(r['activity_date']) for r in rows], dtype=np.int32)
+        keep = days >= self.min_day
+        if not keep.any():
+            return
+        n = int(keep.sum())
+        self._reserve(n)
+        start, end = self._size, self._size + n
+        self._dept[start:end] = np.array([self._dept_index[int(r['dept_id'])] for r in rows], dtype=np.int32)[keep]
+        self._factor[start:end] = np.array([self._factor_index[int(r['factor_id'])] for r in rows], dtype=np.int32)[keep]
+        self._day[start:end] = days[keep]
+        self._value[start:end] = np.array([float(r.get('value') or 0) for r in rows])[keep]
+        self._co2e[start:end] = np.array([float(r['co2e_kg'] or 0) for r in rows])[keep]
+        self._size = end
+        self._evict()
+
+    def warm(self):
+        """Load the hierarchy and the last `window_days` of logs from Supabase"""
+        # Queries fall back to Supabase while the store is (re)loading
+        self.ready = False
+        self._load_dimensions()
+        res = supabase.table("carbon_logs").select("activity_date").order("activity_date").limit(1).execute()
+        with self._lock:
+            self._size = 0
+            self.min_day = None
+            self._oldest_day = _to_day(res.data[0]['activity_date']) if res.data else None
+            self._evict()
+            start_date = str(np.datetime64(self.min_day, 'D'))
+
+        offset = 0
+        while True:
+            res = supabase.table("carbon_logs").select("dept_id, factor_id, value, co2e_kg, activity_date") \
+                .gte("activity_date", start_date).order("id").range(offset, offset + PAGE_SIZE - 1).execute()
+            batch = res.data or []
+            # Stop on an empty page: max-rows on the server may be smaller than PAGE_SIZE
+            if not batch:
+                break
+            with self._lock:
+                self._append_rows(batch)
+            offset += len(batch)
+
+        self.ready = True
+        print(f"Hot store warmed with {self._size} rows ({self._size * ROW_BYTES / 1e6:.1f} MB)")
+
+    def append(self, rows):
+        """Add freshly inserted carbon_logs rows"""
+        if not self.ready or not rows:
+            return
+        try:
+            self._ensure_dimensions(rows)
+            with self._lock:
+                self._append_rows(rows)
+        except Exception as e:
+            print(f"Hot store append failed: {e}")
+
+    # ---- queries ----------------------------------------------------------
+
+    def covers(self, start_date: str = None) -> bool:
+        """True if every log on or after start_date (or every log, without one) is held in the store"""
+        if not self.ready:
+            return False
+        try:
+            start = _to_day(start_date) if start_date else self._oldest_day
+        except ValueError:
+            return False
+        return start is None or start >= self.min_day
+
+    def _mask(self, org_id=None, branch_id=None, dept_id=None, start_date=None, end_date=None):
+        n = self._size
+        mask = np.ones(n, dtype=bool)
+        if dept_id is not None:
+            code = self._dept_index.get(int(dept_id), -1)
+            mask &= self._dept[:n] == code
+        elif branch_id is not None:
+            code = self._branch_index.get(str(branch_id), -1)
+            mask &= np.asarray(self._dept_branch, dtype=np.int32)[self._dept[:n]] == code
+        elif org_id is not None:
+            code = self._org_index.get(str(org_id), -1)
+            dept_org = np.asarray(self._branch_org, dtype=np.int32)[np.asarray(self._dept_branch, dtype=np.int32)]
+            mask &= dept_org[self._dept[:n]] == code
+        if start_date:
+            mask &= self._day[:n] >= _to_day(start_date)
+        if end_date:
+            mask &= self._day[:n] <= _to_day(end_date)
+        return mask
+
+    def sum_by_category(self, **filters):
+        with self._lock:
+            if not self._dept_ids:
+                return {}
+            mask = self._mask(**filters)
+            codes = np.asarray(self._factor_category, dtype=np.int32)[self._factor[:self._size][mask]]
+            totals = np.bincount(codes, weights=self._co2e[:self._size][mask], minlength=len(self._categories))
+            present = np.bincount(codes, minlength=len(self._categories)) > 0
+            return {self._categories[i]: float(totals[i]) for i in np.nonzero(present)[0]}
+
+    def sum_by_department(self, **filters):
+        with self._lock:
+            if not self._dept_ids:
+                return []
+            mask = self._mask(**filters)
+            codes = self._dept[:self._size][mask]
+            totals = np.bincount(codes, weights=self._co2e[:self._size][mask], minlength=len(self._dept_ids))
+            present = np.bincount(codes, minlength=len(self._dept_ids)) > 0
+            return [(self._dept_ids[i], self._dept_names[i], float(totals[i])) for i in np.nonzero(present)[0]]
+
+    def sum_by_period(self, period: str = "month", **filters):
+        with self._lock:
+            mask = self._mask(**filters)
+            days = self._day[:self._size][mask].astype('datetime64[D]')
+            weights = self._co2e[:self._size][mask]
+        keys, inverse = np.unique(bucket_days(days, period), return_inverse=True)
+        totals = np.bincount(inverse, weights=weights, minlength=len(keys))
+        return {str(k): float(v) for k, v in zip(keys, totals)}
+
+
+hot_store = HotStore(
+    window_days=int(os.environ.get("HOT_STORE_WINDOW_DAYS", "365")),
+    max_bytes=int(os.environ.get("HOT_STORE_MAX_MB", "64")) * 1024 * 1024,
+)
+# With more than one instance, also set LIVE_UPDATES_REALTIME so inserts reach every store
+HOT_STORE_ENABLED = os.environ.get("HOT_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
@@ -1,13 +1,15 @@
 from io import StringIO
 from datetime import datetime
 
-import pandas as pd
-
 from app.database import supabase
 from app.services.calculator import calculate_co2e
+from app.services.live_updates import live_hub
 
 
 async def process_csv_log(file_content: str, dept_id: str):
+    # pandas is imported on first upload to keep it out of the startup path
+    import pandas as pd
+
     df = pd.read_csv(StringIO(file_content))
     logs = []
 
@@ -34,7 +36,7 @@ async def process_csv_log(file_content: str, dept_id: str):
             else:
                 activity_date = datetime.now().date().isoformat()
 
-            co2e, factor_id = calculate_co2e(category, activity, value)
+            co2e, factor_id = calculate_co2e(category, activity, value, activity_date)
             logs.append(
                 {
                     "dept_id": int(dept_id),  # Convert to int for int8
@@ -49,5 +51,6 @@ async def process_csv_log(file_content: str, dept_id: str):
             print(f"Skipping row: {e}")
 
     if logs:
-        supabase.table("carbon_logs").insert(logs).execute()
+        res = supabase.table("carbon_logs").insert(logs).execute()
+        live_hub.record_inserts(res.data)
     return len(logs)
\ No newline at end of file
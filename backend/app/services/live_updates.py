@@ -0,0 +1,181 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from app.database import url, key
+from app.services.calculator import category_for_factor
+from app.services.hierarchy import hierarchy
+from app.services.hot_store import hot_store
+
+# Relay inserts and completed recalculations from every instance through Supabase Realtime
+# instead of publishing locally; sql/migrate_schema.sql adds carbon_logs and recalculation_jobs to the
+# supabase_realtime publication
+LIVE_UPDATES_REALTIME = os.environ.get("LIVE_UPDATES_REALTIME", "false").lower() in ("1", "true", "yes")
+QUEUE_SIZE = 100
+SCOPE_TYPES = ("department", "branch", "org")
+
+
+def _period_keys(activity_date: str):
+    day = datetime.strptime(str(activity_date).split('T')[0], "%Y-%m-%d")
+    return {
+        "day": day.strftime("%Y-%m-%d"),
+        "week": (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d"),
+        "month": day.strftime("%Y-%m-01"),
+        "year": day.strftime("%Y-01-01"),
+    }
+
+
+def _add(bucket: dict, key, value: float):
+    bucket[key] = bucket.get(key, 0) + value
+
+
+class LiveHub:
+    """
+    Fan-out of incremental analytics deltas to WebSocket subscribers.
+
+    Each subscriber watches one scope (department, branch or org) and receives,
+    per write, only the amounts to add to its period buckets, category totals
+    and department totals, so open dashboards never need to recompute.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = {}  # (scope_type, scope_id) -> set of asyncio.Queue
+        self._realtime = None
+
+    def bind(self, loop):
+        self._loop = loop
+
+    @property
+    def relaying(self) -> bool:
+        """True while the Supabase Realtime relay is connected"""
+        return self._realtime is not None and self._realtime.is_connected
+
+    def subscribe(self, scope_type: str, scope_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.setdefault((scope_type, str(scope_id)), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, scope_type: str, scope_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get((scope_type, str(scope_id)))
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[(scope_type, str(scope_id))]
+
+    def _deliver(self, scope, message: dict):
+        for queue in list(self._subscribers.get(scope, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and ask it to refetch once
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "scope_type": scope[0], "scope_id": scope[1]})
+
+    def build_deltas(self, rows):
+        """Group inserted carbon_logs rows into one delta message per subscribed scope"""
+        deltas = {}
+        for row in rows:
+            if not row.get('activity_date'):
+                continue
+            dept_id = int(row['dept_id'])
+            hierarchy.ensure_department(dept_id)
+            branch_id, org_id = hierarchy.dept_scope(dept_id)
+            value = float(row['co2e_kg'] or 0)
+            category = category_for_factor(row['factor_id']) or "Unknown"
+            periods = _period_keys(row['activity_date'])
+
+            for scope in (("department", str(dept_id)), ("branch", branch_id), ("org", org_id)):
+                if scope[1] is None or scope not in self._subscribers:
+                    continue
+                delta = deltas.setdefault(scope, {
+                    "type": "delta",
+                    "scope_type": scope[0],
+                    "scope_id": scope[1],
+                    "rows": 0,
+                    "total": 0.0,
+                    "periods": {p: {} for p in periods},
+                    "categories": {},
+                    "departments": {},
+                })
+                delta["rows"] += 1
+                delta["total"] += value
+                for period, period_key in periods.items():
+                    _add(delta["periods"][period], period_key, value)
+                _add(delta["categories"], category, value)
+                _add(delta["departments"], str(dept_id), value)
+        return deltas
+
+    def _dispatch(self, deltas: dict):
+        for scope, message in deltas.items():
+            self._deliver(scope, message)
+
+    def record_inserts(self, rows):
+        """Feed carbon_logs rows inserted by this instance to its hot store and subscribers"""
+        # While the relay is connected they come back through _on_insert instead, on every instance
+        if not rows or self.relaying:
+            return
+        hot_store.append(rows)
+        self.publish(rows)
+
+    def _relay_insert(self, rows):
+        hot_store.append(rows)
+        self.publish(rows, source="realtime")
+
+    def _on_insert(self, payload):
+        # Runs on the event loop; hot store appends and department lookups for deltas query Supabase
+        if self._loop is not None:
+            self._loop.run_in_executor(None, self._relay_insert, [payload["data"]["record"]])
+
+    def publish(self, rows, source: str = "local"):
+        """Push deltas for freshly inserted rows; safe to call from worker threads"""
+        if not rows or not self._subscribers or self._loop is None:
+            return
+        # While the relay is connected every instance (including this one) learns of the insert
+        # from Supabase; if it never started or dropped, keep publishing locally
+        if source == "local" and self.relaying:
+            return
+        try:
+            deltas = self.build_deltas(rows)
+        except Exception as e:
+            print(f"Live update failed: {e}")
+            return
+        if deltas:
+            self._loop.call_soon_threadsafe(self._dispatch, deltas)
+
+    def invalidate(self):
+        """Tell every subscriber to refetch, e.g. after a bulk factor recalculation"""
+        if self._loop is None:
+            return
+        def _send():
+            for scope in list(self._subscribers):
+                self._deliver(scope, {"type": "resync", "scope_type": scope[0], "scope_id": scope[1]})
+        self._loop.call_soon_threadsafe(_send)
+
+    def resync_after_recalculation(self):
+        """Reload this instance's hot store and tell its subscribers to refetch"""
+        if hot_store.ready:
+            hot_store.warm()
+        self.invalidate()
+
+    def _on_job_update(self, payload):
+        # A recalculation finished on some instance; resync without blocking the event loop
+        record = payload["data"]["record"]
+        if record.get("status") == "completed" and record.get("updated") and self._loop is not None:
+            self._loop.run_in_executor(None, self.resync_after_recalculation)
+
+    async def start_realtime(self):
+        """Subscribe to carbon_logs inserts and completed recalculation jobs through Supabase Realtime"""
+        from realtime import AsyncRealtimeClient
+
+        client = AsyncRealtimeClient(f"{url}/realtime/v1", token=key)
+        await client.connect()
+        channel = client.channel("carbon-logs-live")
+        channel.on_postgres_changes("INSERT", self._on_insert, table="carbon_logs", schema="public")
+        channel.on_postgres_changes("UPDATE", self._on_job_update, table="recalculation_jobs", schema="public")
+        await channel.subscribe()
+        self._realtime = client
+
+
+live_hub = LiveHub()
@@ -0,0 +1,171 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.database import supabase
+from app.services.calculator import FACTOR_CACHE_TTL_SECONDS, load_factor_cache, get_factor_versions
+from app.services.live_updates import live_hub
+from app.services.scheduler import scheduler
+
+# Logs fetched and rewritten per batch, and minimum seconds between batches
+BATCH_SIZE = int(os.environ.get("RECALC_BATCH_SIZE", "5000"))
+BATCH_INTERVAL = float(os.environ.get("RECALC_BATCH_INTERVAL", "0.5"))
+# A running job whose progress has not been saved for this long is treated as dead and can be resumed
+STALE_SECONDS = int(os.environ.get("RECALC_STALE_SECONDS", "600"))
+
+# Job rows live in the `recalculation_jobs` table (sql/migrate_schema.sql):
+# id, category, activity, since, status, last_log_id, processed, updated, error, created_at, updated_at
+
+
+def create_job(category: str, activity: str, since: str = None) -> dict:
+    """Record a recalculation job for one factor; run it with run_job()"""
+    res = supabase.table("recalculation_jobs").insert({
+        "category": category,
+        "activity": activity,
+        "since": since,
+        "status": "pending",
+        "last_log_id": 0,
+        "processed": 0,
+        "updated": 0,
+    }).execute()
+    if not res.data:
+        raise ValueError("Failed to create recalculation job")
+    return res.data[0]
+
+
+def get_job(job_id: int) -> dict:
+    res = supabase.table("recalculation_jobs").select("*").eq("id", job_id).single().execute()
+    if not res.data:
+        raise ValueError(f"No recalculation job {job_id}")
+    return res.data
+
+
+def claim_job(job_id: int):
+    """
+    Atomically mark a pending, failed or abandoned job as running.
+
+    Returns the claimed job, or None if another runner holds it or it is completed.
+    """
+    stale_before = (datetime.now() - timedelta(seconds=STALE_SECONDS)).isoformat()
+    res = supabase.table("recalculation_jobs") \
+        .update({"status": "running", "error": None, "updated_at": datetime.now().isoformat()}) \
+        .eq("id", job_id) \
+        .or_(f"status.in.(pending,failed),and(status.eq.running,updated_at.lt.{stale_before})") \
+        .execute()
+    return res.data[0] if res.data else None
+
+
+def _save_progress(job_id: int, **fields):
+    fields["updated_at"] = datetime.now().isoformat()
+    supabase.table("recalculation_jobs").update(fields).eq("id", job_id).execute()
+
+
+def recompute_batch(rows, versions):
+    """
+    Re-resolve the factor version for each log by activity_date and recompute co2e_kg.
+
+    Returns only the rows whose factor_id or co2e_kg changed.
+    """
+    if not rows:
+        return []
+    starts = np.array([v['valid_from'] for v in versions], dtype='datetime64[D]')
+    factors = np.array([v['factor'] for v in versions], dtype=np.float64)
+    ids = np.array([v['id'] for v in versions], dtype=np.int64)
+
+    days = np.array([str(r['activity_date'])[:10] for r in rows], dtype='datetime64[D]')
+    values = np.array([float(r['value'] or 0) for r in rows])
+    old_co2e = np.array([float(r['co2e_kg'] or 0) for r in rows])
+    old_ids = np.array([int(r['factor_id']) for r in rows], dtype=np.int64)
+
+    # Version in effect on each date; dates before the first version use the earliest one
+    idx = np.clip(np.searchsorted(starts, days, side='right') - 1, 0, None)
+    new_co2e = values * factors[idx]
+    new_ids = ids[idx]
+    changed = (new_ids != old_ids) | ~np.isclose(new_co2e, old_co2e)
+
+    updates = []
+    for i in np.nonzero(changed)[0]:
+        row = dict(rows[i])
+        row['factor_id'] = int(new_ids[i])
+        row['co2e_kg'] = float(new_co2e[i])
+        updates.append(row)
+    return updates
+
+
+def run_job(job_id: int, batch_size: int = BATCH_SIZE, interval: float = BATCH_INTERVAL,
+            claimed: dict = None, settle_seconds: float = FACTOR_CACHE_TTL_SECONDS):
+    """
+    Recompute every log for the job's factor in keyset-paginated batches.
+
+    Progress (last_log_id, processed, updated) is saved after each batch, so a
+    job that stops part-way resumes from where it left off when run again.
+    Pass `claimed` when the caller already holds the job via claim_job().
+
+    Web instances keep resolving the old version until their factor cache
+    expires, so once caught up the job waits `settle_seconds` from its start
+    and sweeps again for logs inserted in the meantime.
+    """
+    job = claimed or claim_job(job_id)
+    if job is None:
+        print(f"Recalculation job {job_id} is already running or completed")
+        return get_job(job_id)
+    settle_at = time.monotonic() + settle_seconds
+
+    # Versions may have changed since this process loaded them
+    load_factor_cache()
+    versions = get_factor_versions(job['category'], job['activity'])
+    version_ids = [v['id'] for v in versions]
+
+    last_id = int(job.get('last_log_id') or 0)
+    processed = int(job.get('processed') or 0)
+    updated = int(job.get('updated') or 0)
+    final_sweep = False
+
+    try:
+        while True:
+            started = time.monotonic()
+            query = supabase.table("carbon_logs") \
+                .select("id, dept_id, factor_id, value, co2e_kg, entry_type, activity_date") \
+                .in_("factor_id", version_ids) \
+                .gt("id", last_id)
+            if job.get('since'):
+                query = query.gte("activity_date", job['since'])
+            rows = query.order("id").limit(batch_size).execute().data or []
+            if not rows:
+                if final_sweep:
+                    break
+                wait = settle_at - time.monotonic()
+                if wait > 0:
+                    _save_progress(job_id)
+                    time.sleep(wait)
+                final_sweep = True
+                continue
+
+            changes = recompute_batch(rows, versions)
+            if changes:
+                supabase.table("carbon_logs").upsert(changes, on_conflict="id").execute()
+
+            last_id = int(rows[-1]['id'])
+            processed += len(rows)
+            updated += len(changes)
+            _save_progress(job_id, last_log_id=last_id, processed=processed, updated=updated)
+            print(f"Recalculation job {job_id}: {processed} logs checked, {updated} updated")
+
+            # Rate limit: keep at least `interval` seconds between batches
+            elapsed = time.monotonic() - started
+            if elapsed < interval:
+                time.sleep(interval - elapsed)
+    except Exception as e:
+        _save_progress(job_id, status="failed", error=str(e))
+        print(f"Recalculation job {job_id} failed: {e}")
+        raise
+
+    _save_progress(job_id, status="completed")
+    if updated:
+        # With the relay connected every instance, this one included, resyncs on the job's completion
+        if not live_hub.relaying:
+            live_hub.resync_after_recalculation()
+        scheduler.mark_stale()
+    return get_job(job_id)
@@ -1,14 +1,25 @@
 from typing import Optional
-from groq import Groq
 import os
 from app.database import supabase
 
+_groq_client = None
+
+
+def get_groq_client():
+    """Build the Groq client (and import its SDK) on first use, then reuse it"""
+    global _groq_client
+    if _groq_client is None:
+        from groq import Groq
+        _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _groq_client
+
+
 class RecommendationEngine:
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.client = get_groq_client()
     
     def _get_emission_context(self, org_id: str = None, branch_id: str = None, dept_id: str = None, 
-                           start_date: str = None, end_date: str = None) -> str:
+                           start_date: str = None, end_date: str = None, hotspots: list = None) -> str:
         """
         Fetch emission data context for the AI to generate relevant recommendations
         """
@@ -53,6 +64,15 @@ class RecommendationEngine:
             # Add time period context if provided
             if start_date and end_date:
                 context.append(f"Time period: {start_date} to {end_date}")
+
+            # Add anomaly hotspots so the AI can target concrete departments and categories
+            if hotspots:
+                context.append("Emission hotspots (unusual spikes):")
+                for spot in hotspots:
+                    context.append(
+                        f"- {spot['dept_name']} / {spot['category']} on {spot['period']}: "
+                        f"{spot['co2e_kg']:.2f} kg CO2e vs baseline {spot['baseline_kg']:.2f} kg (z={spot['z_score']:.1f})"
+                    )
                 
         except Exception as e:
             print(f"Error fetching emission context: {str(e)}")
@@ -60,12 +80,17 @@ class RecommendationEngine:
         return "\n".join(context) if context else "No specific emission data available."
     
     def generate_recommendations(self, org_id: str = None, branch_id: str = None, dept_id: int = None,
-                              start_date: str = None, end_date: str = None) -> str:
+                              start_date: str = None, end_date: str = None, hotspots: list = None,
+                              context: str = None, raise_errors: bool = False) -> str:
         """
-        Generate AI-powered recommendations for reducing carbon emissions
+        Generate AI-powered recommendations for reducing carbon emissions.
+
+        Pass a precomputed `context` to skip fetching it, and `raise_errors` to get
+        API and parsing failures as exceptions instead of the fallback advice.
         """
         # Get relevant emission context
-        context = self._get_emission_context(org_id, branch_id, dept_id, start_date, end_date)
+        if context is None:
+            context = self._get_emission_context(org_id, branch_id, dept_id, start_date, end_date, hotspots)
         
         # Determine the scope for the prompt
         scope = []
@@ -127,6 +152,8 @@ class RecommendationEngine:
                 return recommendations
             except json.JSONDecodeError:
                 print(f"Failed to parse JSON from AI: {content}")
+                if raise_errors:
+                    raise
                 # Fallback
                 return [{
                     "action": "Review Energy Usage",
@@ -137,6 +164,8 @@ class RecommendationEngine:
             
         except Exception as e:
             print(f"Error generating recommendations: {str(e)}")
+            if raise_errors:
+                raise
             return [{
                 "action": "Check System Connection",
                 "description": "Unable to generate recommendations due to a system error.",
@@ -0,0 +1,39 @@
+from app.database import supabase
+
+PAGE_SIZE = 1000
+
+
+def fetch_all(build_query, page_size: int = PAGE_SIZE):
+    """
+    Page through a PostgREST query with .range() until an empty page.
+
+    `build_query` returns a fresh query builder for each page. Stopping on an
+    empty page rather than a short one keeps this correct when the server's
+    max-rows is smaller than page_size.
+    """
+    rows, offset = [], 0
+    while True:
+        page = build_query().range(offset, offset + page_size - 1).execute().data or []
+        if not page:
+            return rows
+        rows.extend(page)
+        offset += len(page)
+
+
+def fetch_rollup(scope_type: str, scope_ids, period: str = "month", start_date: str = None,
+                 end_date: str = None, by_department: bool = False):
+    """
+    Emissions grouped by scope, period and category (and optionally department) in Postgres.
+
+    See sql/get_emission_rollup.sql. Scope ids go in the RPC body, so thousands of
+    them do not end up in a URL.
+    """
+    params = {
+        "p_scope_type": scope_type,
+        "p_scope_ids": [str(s) for s in scope_ids],
+        "p_period": period,
+        "p_start_date": start_date,
+        "p_end_date": end_date,
+        "p_by_department": by_department,
+    }
+    return fetch_all(lambda: supabase.rpc("get_emission_rollup", params))
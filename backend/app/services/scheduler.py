@@ -0,0 +1,298 @@
+import asyncio
+import os
+import random
+import socket
+from datetime import date, datetime, timedelta, timezone
+
+from app.database import supabase
+from app.services.anomaly_detector import detect_anomalies
+from app.services.comparison import SCOPES, compare_scopes
+from app.services.hierarchy import hierarchy
+from app.services.recommendation_engine import RecommendationEngine
+from app.services.rollup import fetch_all, fetch_rollup
+
+PRECOMPUTE_ENABLED = os.environ.get("PRECOMPUTE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Local off-peak window, "HH:MM-HH:MM"; may wrap past midnight
+PRECOMPUTE_WINDOW = os.environ.get("PRECOMPUTE_WINDOW", "01:00-05:00")
+PRECOMPUTE_CONCURRENCY = int(os.environ.get("PRECOMPUTE_CONCURRENCY", "4"))
+PRECOMPUTE_LLM_CONCURRENCY = int(os.environ.get("PRECOMPUTE_LLM_CONCURRENCY", "2"))
+PRECOMPUTE_MAX_RETRIES = int(os.environ.get("PRECOMPUTE_MAX_RETRIES", "3"))
+PRECOMPUTE_BACKOFF = float(os.environ.get("PRECOMPUTE_BACKOFF", "2.0"))
+POLL_SECONDS = 300
+# A pass holds the `precompute` row of `scheduler_locks` for at most this long,
+# so a crashed instance does not block the next pass indefinitely
+PRECOMPUTE_LOCK_SECONDS = int(os.environ.get("PRECOMPUTE_LOCK_SECONDS", "21600"))
+LOCK_NAME = "precompute"
+HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Results live in the `precomputed_scopes` table (sql/migrate_schema.sql), unique on (scope_type, scope_id):
+# scope_type, scope_id, last_log_id, generation, context, recommendations, hotspots, aggregates, computed_at
+
+
+def in_window(now: datetime, window: str = PRECOMPUTE_WINDOW) -> bool:
+    start, end = (datetime.strptime(t.strip(), "%H:%M").time() for t in window.split("-"))
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def latest_log_id(scope_type: str, scope_id: str):
+    """Highest carbon_logs id in the scope, or None if it has no logs"""
+    column = SCOPES[scope_type][0]
+    select = "id"
+    if scope_type == "branch":
+        select += ", departments!inner(branch_id)"
+    elif scope_type == "org":
+        select += ", departments!inner(branches!inner(org_id))"
+    res = supabase.table("carbon_logs").select(select).eq(column, scope_id) \
+        .order("id", desc=True).limit(1).execute()
+    return int(res.data[0]['id']) if res.data else None
+
+
+def data_generation():
+    """
+    Marker of the latest recalculation that rewrote stored emissions, or None.
+
+    Completed jobs are never updated again, so their updated_at only moves
+    forward and every instance sees the same value.
+    """
+    res = supabase.table("recalculation_jobs").select("updated_at") \
+        .eq("status", "completed").gt("updated", 0) \
+        .order("updated_at", desc=True).limit(1).execute()
+    return res.data[0]['updated_at'] if res.data else None
+
+
+def _utc(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def claim_pass(daily: bool = False) -> bool:
+    """
+    Take the cross-instance precompute lock with a conditional update.
+
+    With `daily`, also require that no pass finished today, so only one of the
+    autoscaled instances runs the nightly walk.
+    """
+    now = datetime.now(timezone.utc)
+    query = supabase.table("scheduler_locks") \
+        .update({"holder": HOLDER, "locked_until": _utc(now + timedelta(seconds=PRECOMPUTE_LOCK_SECONDS))}) \
+        .eq("name", LOCK_NAME) \
+        .or_(f"locked_until.is.null,locked_until.lt.{_utc(now)}")
+    if daily:
+        query = query.lt("last_run_on", date.today().isoformat())
+    return bool(query.execute().data)
+
+
+def release_pass(finished: bool):
+    fields = {"locked_until": None}
+    if finished:
+        fields["last_run_on"] = date.today().isoformat()
+    supabase.table("scheduler_locks").update(fields).eq("name", LOCK_NAME).eq("holder", HOLDER).execute()
+
+
+class PrecomputeScheduler:
+    """
+    Walks the org hierarchy during the off-peak window and stores, per scope,
+    the recommendation context, LLM recommendations and dashboard aggregates.
+
+    Scopes with no logs newer than their last run, and no recalculation since,
+    are skipped. Scope work and
+    LLM calls have separate concurrency limits, and failures are retried with
+    exponential backoff.
+    """
+
+    def __init__(self):
+        self._results = {}  # (scope_type, scope_id) -> stored row
+        self._force = False
+        self._running = False
+        self.last_run = None
+
+    def mark_stale(self):
+        """Recompute every scope on the next run, e.g. after emission factors changed"""
+        self._force = True
+
+    def _load_markers(self):
+        rows = fetch_all(lambda: supabase.table("precomputed_scopes")
+                         .select("scope_type, scope_id, last_log_id, generation").order("scope_type").order("scope_id"))
+        return {(r['scope_type'], str(r['scope_id'])): (r.get('last_log_id'), r.get('generation')) for r in rows}
+
+    def _scopes(self):
+        hierarchy.ensure_fresh()
+        scopes = [("org", org_id) for org_id in hierarchy.organizations]
+        scopes += [("branch", branch_id) for branch_id in hierarchy.branches]
+        scopes += [("department", str(dept_id)) for dept_id in hierarchy.departments]
+        return scopes
+
+    def aggregates(self, scope_type: str, scope_id: str):
+        """Dashboard aggregates for a scope: monthly series, categories and department totals"""
+        summary = compare_scopes(scope_type, [scope_id], period="month")
+        aggregates = {
+            "periods": summary["periods"],
+            **{k: v for k, v in summary["scopes"][0].items() if k not in ("scope_id", "name")},
+        }
+        if scope_type == "department":
+            return aggregates
+
+        # Department totals are grouped in Postgres within the scope rather than
+        # sending every department id of an org in the request
+        if scope_type == "branch":
+            depts = {str(d['id']): d['name'] for d in hierarchy.list_departments(scope_id)}
+        else:
+            branch_ids = {b['id'] for b in hierarchy.list_branches(scope_id)}
+            depts = {str(d): v['name'] for d, v in hierarchy.departments.items() if v['branch_id'] in branch_ids}
+        totals = dict.fromkeys(depts, 0.0)
+        for row in fetch_rollup(scope_type, [scope_id], period="year", by_department=True):
+            dept_id = str(row['dept_id'])
+            depts.setdefault(dept_id, row.get('dept_name'))
+            totals[dept_id] = totals.get(dept_id, 0.0) + float(row['total_co2e_kg'] or 0)
+        if totals:
+            aggregates["departments"] = sorted(
+                ({"dept_id": d, "dept_name": depts.get(d), "total_emissions": t} for d, t in totals.items()),
+                key=lambda x: x["total_emissions"], reverse=True,
+            )
+        return aggregates
+
+    async def _with_backoff(self, fn, *args, **kwargs):
+        for attempt in range(PRECOMPUTE_MAX_RETRIES):
+            try:
+                return await asyncio.to_thread(fn, *args, **kwargs)
+            except Exception:
+                if attempt == PRECOMPUTE_MAX_RETRIES - 1:
+                    raise
+                await asyncio.sleep(PRECOMPUTE_BACKOFF * (2 ** attempt) * (1 + random.random()))
+
+    async def _precompute_scope(self, scope_type: str, scope_id: str, marker, generation, force,
+                                scope_limit, llm_limit):
+        async with scope_limit:
+            latest = await self._with_backoff(latest_log_id, scope_type, scope_id)
+            if latest is None:
+                return "skipped"
+            last_log_id, last_generation = marker or (None, None)
+            up_to_date = last_log_id is not None and latest <= last_log_id and last_generation == generation
+            if not force and up_to_date:
+                return "skipped"
+
+            if scope_type == "department":
+                kwargs = {"dept_id": int(scope_id)}
+            elif scope_type == "branch":
+                kwargs = {"branch_id": scope_id}
+            else:
+                kwargs = {"org_id": scope_id}
+            engine = RecommendationEngine()
+            hotspots = await self._with_backoff(detect_anomalies, limit=5, **kwargs)
+            context = await asyncio.to_thread(engine._get_emission_context, hotspots=hotspots, **kwargs)
+            aggregates = await self._with_backoff(self.aggregates, scope_type, scope_id)
+            async with llm_limit:
+                recommendations = await self._with_backoff(
+                    engine.generate_recommendations, context=context, raise_errors=True, **kwargs
+                )
+
+            row = {
+                "scope_type": scope_type,
+                "scope_id": scope_id,
+                "last_log_id": latest,
+                "generation": generation,
+                "context": context,
+                "hotspots": hotspots,
+                "recommendations": recommendations,
+                "aggregates": aggregates,
+                "computed_at": datetime.now().isoformat(),
+            }
+            await self._with_backoff(
+                lambda: supabase.table("precomputed_scopes").upsert(row, on_conflict="scope_type,scope_id").execute()
+            )
+            self._results[(scope_type, scope_id)] = row
+            return "computed"
+
+    async def run_once(self, daily: bool = False):
+        """
+        Precompute every scope in the hierarchy that has new logs.
+
+        Returns None without running if another pass holds the lock (or, with
+        `daily`, already finished today).
+        """
+        if self._running:
+            return None
+        self._running = True
+        finished = False
+        try:
+            if not await asyncio.to_thread(claim_pass, daily):
+                print("Precompute pass skipped: another instance holds the lock or already ran today")
+                self._running = False
+                return None
+        except Exception:
+            self._running = False
+            raise
+        # Take the flag now so a mark_stale() arriving mid-run applies to the next run
+        force, self._force = self._force, False
+        try:
+            generation = await asyncio.to_thread(data_generation)
+            markers = await asyncio.to_thread(self._load_markers)
+            scopes = await asyncio.to_thread(self._scopes)
+            scope_limit = asyncio.Semaphore(PRECOMPUTE_CONCURRENCY)
+            llm_limit = asyncio.Semaphore(PRECOMPUTE_LLM_CONCURRENCY)
+            outcomes = await asyncio.gather(
+                *(self._precompute_scope(t, i, markers.get((t, i)), generation, force, scope_limit, llm_limit)
+                  for t, i in scopes),
+                return_exceptions=True,
+            )
+            summary = {"computed": 0, "skipped": 0, "failed": 0}
+            for (scope_type, scope_id), outcome in zip(scopes, outcomes):
+                if isinstance(outcome, Exception):
+                    summary["failed"] += 1
+                    print(f"Precompute failed for {scope_type} {scope_id}: {outcome}")
+                else:
+                    summary[outcome] += 1
+            self.last_run = {"finished_at": datetime.now().isoformat(), **summary}
+            print(f"Precompute run finished: {summary}")
+            finished = True
+            return self.last_run
+        except Exception:
+            self._force = self._force or force
+            raise
+        finally:
+            self._running = False
+            try:
+                await asyncio.to_thread(release_pass, finished)
+            except Exception as e:
+                print(f"Releasing the precompute lock failed: {e}")
+
+    async def run_forever(self):
+        """Run once per day inside the off-peak window"""
+        last_day = None
+        while True:
+            now = datetime.now()
+            if in_window(now) and last_day != now.date():
+                try:
+                    if await self.run_once(daily=True) is not None:
+                        last_day = now.date()
+                except Exception as e:
+                    print(f"Precompute run failed: {e}")
+            await asyncio.sleep(POLL_SECONDS)
+
+    def get_fresh(self, scope_type: str, scope_id: str):
+        """Stored results for a scope if no logs were added and no recalculation ran since they were computed"""
+        if self._force:
+            return None
+        key = (scope_type, str(scope_id))
+        generation = data_generation()
+        latest = latest_log_id(scope_type, str(scope_id))
+
+        def is_fresh(row):
+            return row.get('generation') == generation and row.get('last_log_id') == latest
+
+        row = self._results.get(key)
+        if row is not None and is_fresh(row):
+            return row
+        # Missing or stale here; another instance may have recomputed it since
+        res = supabase.table("precomputed_scopes").select("*") \
+            .eq("scope_type", scope_type).eq("scope_id", str(scope_id)).execute()
+        if not res.data:
+            self._results.pop(key, None)
+            return None
+        row = self._results[key] = res.data[0]
+        return row if is_fresh(row) else None
+
+
+scheduler = PrecomputeScheduler()
@@ -0,0 +1,65 @@
+import os
+import time
+
+from app.database import get_supabase
+from app.services.calculator import load_factor_cache
+from app.services.hierarchy import hierarchy
+from app.services.hot_store import hot_store, HOT_STORE_ENABLED
+
+# Budget for importing app.main, checked once at startup
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+readiness = {
+    "supabase": False,
+    "factors": False,
+    "hierarchy": False,
+    "hot_store": not HOT_STORE_ENABLED,
+}
+timings_ms = {}
+
+
+def is_ready() -> bool:
+    return all(readiness.values())
+
+
+# Backoff between retries of failed steps, in seconds
+RETRY_INITIAL = 1.0
+RETRY_MAX = 60.0
+
+
+def _step(name: str, fn):
+    started = time.perf_counter()
+    try:
+        fn()
+        readiness[name] = True
+    except Exception as e:
+        print(f"Warm-up step '{name}' failed: {e}")
+    timings_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def run_warmup():
+    """
+    Open connections and preload caches; /readyz reports ready once every step succeeds.
+
+    Failed steps are retried with exponential backoff until they succeed, so a
+    transient Supabase error during boot does not leave the instance unready.
+    """
+    steps = {
+        "supabase": lambda: get_supabase().table("organizations").select("id").limit(1).execute(),
+        "factors": load_factor_cache,
+        "hierarchy": hierarchy.load,
+    }
+    if HOT_STORE_ENABLED:
+        steps["hot_store"] = hot_store.warm
+
+    delay = RETRY_INITIAL
+    while True:
+        for name, fn in steps.items():
+            if not readiness[name]:
+                _step(name, fn)
+        if is_ready():
+            break
+        print(f"Warm-up incomplete, retrying in {delay:.0f} s")
+        time.sleep(delay)
+        delay = min(delay * 2, RETRY_MAX)
+    print(f"Warm-up finished in {sum(timings_ms.values()):.0f} ms, ready={is_ready()}")
@@ -0,0 +1,73 @@
+-- Grouped emissions for many scopes in one call, used by anomaly detection,
+-- multi-scope comparison and precomputed aggregates (app/services/rollup.py).
+--
+-- p_scope_type:    'department' | 'branch' | 'org'
+-- p_scope_ids:     ids of that type (text; department ids are cast)
+-- p_period:        'day' | 'week' | 'month' | 'year' (date_trunc unit; weeks start Monday)
+-- p_by_department: also group by department within each scope
+--
+-- Rows are ordered so callers can page through them with .range().
+create or replace function get_emission_rollup(
+    p_scope_type text,
+    p_scope_ids text[],
+    p_period text default 'month',
+    p_start_date date default null,
+    p_end_date date default null,
+    p_by_department boolean default false
+)
+returns table (
+    scope_id text,
+    dept_id bigint,
+    dept_name text,
+    period_start date,
+    category text,
+    total_co2e_kg double precision,
+    log_count bigint
+)
+language plpgsql
+stable
+as $$
+declare
+    v_dept_ids bigint[];
+begin
+    -- Resolve the scopes to department ids first, each through an indexable
+    -- predicate, so carbon_logs is only read through carbon_logs_dept_date_idx
+    if p_scope_type = 'department' then
+        v_dept_ids := p_scope_ids::bigint[];
+    elsif p_scope_type = 'branch' then
+        select array_agg(d.id) into v_dept_ids
+        from departments d
+        where d.branch_id in (select b.id from branches b where b.id::text = any(p_scope_ids));
+    else
+        select array_agg(d.id) into v_dept_ids
+        from departments d
+        join branches b on b.id = d.branch_id
+        where b.org_id in (select o.id from organizations o where o.id::text = any(p_scope_ids));
+    end if;
+
+    return query
+    select
+        case p_scope_type
+            when 'department' then l.dept_id::text
+            when 'branch' then d.branch_id::text
+            else b.org_id::text
+        end as scope_id,
+        case when p_by_department then l.dept_id::bigint end as dept_id,
+        case when p_by_department then max(d.name)::text end as dept_name,
+        date_trunc(p_period, l.activity_date::timestamp)::date as period_start,
+        f.category::text,
+        sum(l.co2e_kg)::double precision as total_co2e_kg,
+        count(*) as log_count
+    from carbon_logs l
+    join departments d on d.id = l.dept_id
+    join branches b on b.id = d.branch_id
+    join emission_factors f on f.id = l.factor_id
+    where l.dept_id = any(v_dept_ids)
+      and (p_start_date is null or l.activity_date >= p_start_date)
+      and (p_end_date is null or l.activity_date <= p_end_date)
+    group by 1, 2, 4, 5
+    order by 1, 2, 4, 5;
+end;
+$$;
+
+create index if not exists carbon_logs_dept_date_idx on carbon_logs (dept_id, activity_date);
@@ -0,0 +1,132 @@
+-- Schema for versioned emission factors, factor recalculation jobs,
+-- precomputed scope results, the scheduler lock and comparison denominators.
+-- Safe to run more than once against the baseline database (Supabase SQL
+-- editor or psql).
+
+-- Versioned emission factors (app/services/calculator.py, app/scripts/seed_factors.py).
+-- Existing rows become the first version of their factor.
+alter table emission_factors add column if not exists valid_from date not null default '2000-01-01';
+alter table emission_factors add column if not exists valid_to date;
+
+-- A factor now has one row per version: replace unique (category, activity)
+-- with unique (category, activity, valid_from)
+do $$
+declare
+    c record;
+begin
+    for c in
+        select con.conname
+        from pg_constraint con
+        where con.conrelid = 'emission_factors'::regclass
+          and con.contype = 'u'
+          and (select array_agg(a.attname::text order by a.attname)
+               from pg_attribute a
+               where a.attrelid = con.conrelid and a.attnum = any(con.conkey)) = array['activity', 'category']
+    loop
+        execute format('alter table emission_factors drop constraint %I', c.conname);
+    end loop;
+
+    if not exists (select 1 from pg_constraint where conname = 'emission_factors_category_activity_valid_from_key') then
+        alter table emission_factors
+            add constraint emission_factors_category_activity_valid_from_key unique (category, activity, valid_from);
+    end if;
+end;
+$$;
+
+-- Add (or correct) a factor version and close the version it supersedes in one
+-- transaction, so a failure never leaves a factor without a current version
+create or replace function publish_factor_version(
+    p_category text,
+    p_activity text,
+    p_factor double precision,
+    p_unit text,
+    p_source text,
+    p_valid_from date
+)
+returns setof emission_factors
+language plpgsql
+as $$
+begin
+    insert into emission_factors (category, activity, factor, unit, source, valid_from, valid_to)
+    values (p_category, p_activity, p_factor, p_unit, p_source, p_valid_from, null)
+    on conflict (category, activity, valid_from)
+    do update set factor = excluded.factor, unit = excluded.unit, source = excluded.source;
+
+    update emission_factors
+    set valid_to = p_valid_from - 1
+    where category = p_category
+      and activity = p_activity
+      and valid_from < p_valid_from
+      and (valid_to is null or valid_to >= p_valid_from);
+
+    return query
+    select * from emission_factors
+    where category = p_category and activity = p_activity and valid_from = p_valid_from;
+end;
+$$;
+
+-- Resumable factor recalculation jobs (app/services/recalculator.py)
+create table if not exists recalculation_jobs (
+    id bigint generated by default as identity primary key,
+    category text not null,
+    activity text not null,
+    since date,
+    status text not null default 'pending' check (status in ('pending', 'running', 'completed', 'failed')),
+    last_log_id bigint not null default 0,
+    processed bigint not null default 0,
+    updated bigint not null default 0,
+    error text,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+-- Keyset scans of one factor's logs during recalculation
+create index if not exists carbon_logs_factor_id_idx on carbon_logs (factor_id, id);
+
+-- Off-peak precomputed recommendations and aggregates (app/services/scheduler.py)
+create table if not exists precomputed_scopes (
+    scope_type text not null check (scope_type in ('department', 'branch', 'org')),
+    scope_id text not null,
+    last_log_id bigint,
+    generation text,
+    context jsonb,
+    recommendations jsonb,
+    hotspots jsonb,
+    aggregates jsonb,
+    computed_at timestamptz,
+    primary key (scope_type, scope_id)
+);
+alter table precomputed_scopes add column if not exists generation text;
+
+-- One precompute pass at a time across instances, and one nightly pass per day
+-- (claim_pass/release_pass in app/services/scheduler.py)
+create table if not exists scheduler_locks (
+    name text primary key,
+    holder text,
+    locked_until timestamptz,
+    last_run_on date not null default '2000-01-01'
+);
+insert into scheduler_locks (name) values ('precompute') on conflict (name) do nothing;
+
+-- Per-scope denominators for normalised comparisons (compare_scopes normalize_by)
+alter table organizations add column if not exists headcount integer;
+alter table organizations add column if not exists floor_area double precision;
+alter table branches add column if not exists headcount integer;
+alter table branches add column if not exists floor_area double precision;
+alter table departments add column if not exists headcount integer;
+alter table departments add column if not exists floor_area double precision;
+
+-- Supabase Realtime relay (LIVE_UPDATES_REALTIME): carbon_logs inserts and
+-- recalculation_jobs updates must be published
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['carbon_logs', 'recalculation_jobs'] loop
+        if not exists (select 1 from pg_publication_tables
+                       where pubname = 'supabase_realtime' and schemaname = 'public' and tablename = t) then
+            execute format('alter publication supabase_realtime add table public.%I', t);
+        end if;
+    end loop;
+end;
+$$;
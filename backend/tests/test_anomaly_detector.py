@@ -0,0 +1,88 @@
+import numpy as np
+
+from app.services import anomaly_detector
+from app.services.anomaly_detector import _trailing_stats, build_emission_matrix, score_matrix
+
+
+def test_trailing_stats_uses_only_preceding_window():
+    series = np.array([[1.0, 2.0, 3.0, 4.0, 5.0]])
+    mean, std, count = _trailing_stats(series, window=2)
+    assert count.tolist() == [[0, 1, 2, 2, 2]]
+    assert mean.tolist() == [[0.0, 1.0, 1.5, 2.5, 3.5]]
+    assert np.allclose(std[0, 2:], 0.5)
+
+
+def test_score_matrix_flags_spike_on_flat_series():
+    matrix = np.full((2, 1, 40), 10.0)
+    matrix[1, 0, 35] = 100.0
+    _, z, count = score_matrix(matrix, window=28)
+    flagged = (z >= 3) & (count >= 7)
+    assert np.argwhere(flagged).tolist() == [[1, 0, 35]]
+
+
+def test_score_matrix_seasonal_compares_same_weekday():
+    # Weekly pattern: every 7th day is high, which is normal for that weekday
+    matrix = np.full((1, 1, 70), 10.0)
+    matrix[0, 0, ::7] = 50.0
+    _, rolling_z, _ = score_matrix(matrix, window=28, method="rolling")
+    _, seasonal_z, count = score_matrix(matrix, window=4, method="seasonal")
+    assert rolling_z[0, 0, 63] > 2
+    assert abs(seasonal_z[0, 0, 63]) < 1e-6
+    assert count[0, 0, 63] == 4
+
+
+def test_build_emission_matrix_aligns_days_and_sums_duplicates():
+    rows = [
+        {"dept_id": 7, "dept_name": "Ops", "category": "Energy", "period_start": "2025-01-02", "total_co2e_kg": 3.0},
+        {"dept_id": 7, "dept_name": "Ops", "category": "Energy", "period_start": "2025-01-02", "total_co2e_kg": 2.0},
+        {"dept_id": 3, "dept_name": "HR", "category": "Waste", "period_start": "2025-01-04", "total_co2e_kg": 1.0},
+        {"dept_id": 3, "dept_name": "HR", "category": "Waste", "period_start": "2025-02-01", "total_co2e_kg": 9.0},
+    ]
+    matrix, dept_ids, names, categories, first = build_emission_matrix(rows, "2025-01-01", "2025-01-05")
+    assert matrix.shape == (2, 2, 5)
+    assert dept_ids.tolist() == [3, 7]
+    assert categories.tolist() == ["Energy", "Waste"]
+    assert matrix[1, 0, 1] == 5.0
+    assert matrix[0, 1, 3] == 1.0
+    assert matrix.sum() == 6.0  # the February row is outside the range
+    assert names == {7: "Ops", 3: "HR"}
+
+
+def test_detect_anomalies_defaults_to_bounded_window(monkeypatch):
+    calls = []
+
+    def fake_fetch(org_id, branch_id, dept_id, start_date, end_date):
+        calls.append((start_date, end_date))
+        return []
+
+    monkeypatch.setattr(anomaly_detector, "_fetch_daily_totals", fake_fetch)
+    assert anomaly_detector.detect_anomalies(org_id="o1", end_date="2025-06-30", window=28) == []
+    # 90 scored days plus a 28-day lookback
+    assert calls == [("2025-03-05", "2025-06-30")]
+
+
+def test_score_matrix_ignores_days_without_logs():
+    # The same bill logged on an irregular schedule: quiet stretches are not drops to zero
+    matrix = np.zeros((1, 1, 120))
+    logged = [0, 2, 5, 9, 12, 14, 19, 22, 26, 30, 50, 53, 55, 80, 83, 86, 88, 91, 94, 97, 110]
+    matrix[0, 0, logged] = 150.0
+    _, z, count = score_matrix(matrix, window=28)
+    assert count[0, 0, 30] == 8  # logged days among the 28 before day 30, not 28 calendar days
+    assert not ((z >= 3) & (count >= 7) & (matrix > 0)).any()
+
+    _, dense_z, dense_count = score_matrix(matrix, window=28, observed=np.ones(matrix.shape, dtype=bool))
+    assert ((dense_z >= 3) & (dense_count >= 7) & (matrix > 0)).any()
+
+
+def test_detect_anomalies_scores_departments_in_blocks(monkeypatch):
+    rows = []
+    for dept in range(5):
+        for day in range(1, 29):
+            value = 500.0 if (dept == 3 and day == 25) else 10.0 + day % 3
+            rows.append({"dept_id": dept, "dept_name": f"D{dept}", "category": "Energy",
+                         "period_start": f"2025-02-{day:02d}", "total_co2e_kg": value})
+    monkeypatch.setattr(anomaly_detector, "_fetch_daily_totals", lambda *args: rows)
+    monkeypatch.setattr(anomaly_detector, "MAX_CELLS", 40)  # one department per block
+    hotspots = anomaly_detector.detect_anomalies(org_id="o1", start_date="2025-02-20", end_date="2025-02-28",
+                                                 window=14)
+    assert [(h["dept_id"], h["period"]) for h in hotspots] == [(3, "2025-02-25")]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from app.services import comparison
+from app.services.hot_store import bucket_days
+
+
+def _rollup(scope_id, period_start, category, co2e):
+    return {"scope_id": scope_id, "dept_id": None, "dept_name": None, "period_start": period_start,
+            "category": category, "total_co2e_kg": co2e, "log_count": 1}
+
+
+def test_bucket_days_matches_postgres_date_trunc():
+    days = np.array(["2024-03-06", "2024-03-11", "2024-12-31"], dtype="datetime64[D]")
+    # date_trunc('week') starts on Monday
+    assert [str(d) for d in bucket_days(days, "week")] == ["2024-03-04", "2024-03-11", "2024-12-30"]
+    assert [str(d) for d in bucket_days(days, "month")] == ["2024-03-01", "2024-03-01", "2024-12-01"]
+    assert [str(d) for d in bucket_days(days, "year")] == ["2024-01-01", "2024-01-01", "2024-01-01"]
+
+
+def test_compare_scopes_aligns_series_across_scopes(monkeypatch):
+    rows = [
+        _rollup("b1", "2024-01-01", "Energy", 10.0),
+        _rollup("b1", "2024-03-01", "Waste", 5.0),
+        _rollup("b2", "2024-02-01", "Energy", 4.0),
+        _rollup("other", "2024-02-01", "Energy", 99.0),
+    ]
+    monkeypatch.setattr(comparison, "fetch_rollup", lambda *args, **kwargs: rows)
+    result = comparison.compare_scopes("branch", ["b1", "b2", "b3"], denominators={"b1": 5, "b2": 2})
+
+    assert result["periods"] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert result["categories"] == ["Energy", "Waste"]
+    b1, b2, b3 = result["scopes"]
+    assert b1["time_series"] == [2.0, 0.0, 1.0]
+    assert b2["time_series"] == [0.0, 2.0, 0.0]
+    assert b2["categories"] == {"Energy": 2.0, "Waste": 0.0}
+    # No denominator: reported as null instead of dividing by zero
+    assert b3["total_emissions"] is None
+
+
+def test_compare_scopes_rejects_unknown_normalisation_column(monkeypatch):
+    monkeypatch.setattr(comparison, "fetch_rollup", lambda *args, **kwargs: [])
+    with pytest.raises(ValueError):
+        comparison.compare_scopes("branch", ["b1"], normalize_by="id; drop table")
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from app.services.hot_store import ROW_BYTES, HotStore, _to_day, bucket_days
+
+
+def _store(max_rows=1000, window_days=3650):
+    store = HotStore(window_days=window_days, max_bytes=max_rows * ROW_BYTES)
+    store._register_department(1, "Ops", "b1", "o1")
+    store._register_department(2, "HR", "b1", "o1")
+    store._register_department(3, "Lab", "b2", "o2")
+    store._register_factor(10, "Energy")
+    store._register_factor(11, "Waste")
+    store._evict()
+    store.ready = True
+    return store
+
+
+def _row(dept_id, factor_id, co2e, day):
+    return {"dept_id": dept_id, "factor_id": factor_id, "value": 1, "co2e_kg": co2e, "activity_date": day}
+
+
+def _days_ago(n):
+    return (date.today() - timedelta(days=n)).isoformat()
+
+
+def test_mask_filters_by_scope_and_date():
+    store = _store()
+    store._append_rows([
+        _row(1, 10, 1.0, _days_ago(5)),
+        _row(2, 11, 2.0, _days_ago(4)),
+        _row(3, 10, 4.0, _days_ago(3)),
+    ])
+    assert store.sum_by_category(org_id="o1") == {"Energy": 1.0, "Waste": 2.0}
+    assert store.sum_by_category(branch_id="b2") == {"Energy": 4.0}
+    assert store.sum_by_department(dept_id=2) == [(2, "HR", 2.0)]
+    assert store._mask(org_id="o1", start_date=_days_ago(4)).tolist() == [False, True, False]
+    assert store._mask(org_id="unknown").sum() == 0
+
+
+def test_evict_drops_rows_outside_window():
+    store = _store(window_days=10)
+    store._append_rows([_row(1, 10, 1.0, _days_ago(20)), _row(1, 10, 2.0, _days_ago(5))])
+    assert store._size == 1
+    assert store.covers(_days_ago(10))
+    assert not store.covers(_days_ago(11))
+    # Without a start date only a store holding all history can answer
+    assert not store.covers()
+
+
+def test_covers_all_history_when_nothing_was_evicted():
+    store = _store(window_days=30)
+    store._append_rows([_row(1, 10, 1.0, _days_ago(20)), _row(2, 11, 2.0, _days_ago(5))])
+    assert store.covers()
+    store._append_rows([_row(1, 10, 4.0, _days_ago(40))])  # a late backfill outside the window
+    assert not store.covers()
+
+
+def test_evict_drops_oldest_days_over_budget():
+    store = _store(max_rows=3)
+    store._append_rows([_row(1, 10, float(i), _days_ago(10 - i)) for i in range(5)])
+    assert store._size <= 3
+    assert store._day[:store._size].min() == _to_day(_days_ago(8))
+    assert store.min_day == _to_day(_days_ago(8))
+
+
+def test_evict_keeps_newest_day_when_it_alone_exceeds_budget():
+    store = _store(max_rows=2)
+    store._append_rows([_row(1, 10, 1.0, _days_ago(0)) for _ in range(5)])
+    assert store._size == 5
+    assert store.min_day == _to_day(_days_ago(0))
+    # Later inserts for the same day are still accepted
+    store._append_rows([_row(1, 10, 1.0, _days_ago(0))])
+    assert store._size == 6
+
+
+def test_bucket_days_truncates_periods():
+    days = np.array(["2025-03-05", "2025-03-09", "2025-12-31"], dtype="datetime64[D]")
+    assert [str(d) for d in bucket_days(days, "week")] == ["2025-03-03", "2025-03-03", "2025-12-29"]
+    assert [str(d) for d in bucket_days(days, "month")] == ["2025-03-01", "2025-03-01", "2025-12-01"]
+    assert [str(d) for d in bucket_days(days, "year")] == ["2025-01-01", "2025-01-01", "2025-01-01"]
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from app.services import live_updates
+from app.services.live_updates import LiveHub
+
+
+def _hub(monkeypatch):
+    monkeypatch.setattr(live_updates, "category_for_factor", lambda factor_id: "Energy")
+    monkeypatch.setattr(live_updates.hierarchy, "ensure_department", lambda dept_id: None)
+    monkeypatch.setattr(live_updates.hierarchy, "dept_scope", lambda dept_id: ("b1", "o1"))
+    hub = LiveHub()
+    hub.bind(asyncio.new_event_loop())
+    return hub
+
+
+ROW = {"dept_id": 1, "factor_id": 10, "co2e_kg": 2.5, "activity_date": "2024-03-06"}
+
+
+def test_local_publish_falls_back_when_relay_is_down(monkeypatch):
+    hub = _hub(monkeypatch)
+    queue = hub.subscribe("branch", "b1")
+    hub._realtime = SimpleNamespace(is_connected=False)
+    hub.publish([ROW])
+    hub._loop.run_until_complete(asyncio.sleep(0))
+    message = queue.get_nowait()
+    assert message["total"] == 2.5
+    assert message["periods"]["week"] == {"2024-03-04": 2.5}
+
+
+def test_local_publish_is_skipped_while_relay_is_connected(monkeypatch):
+    hub = _hub(monkeypatch)
+    queue = hub.subscribe("org", "o1")
+    hub._realtime = SimpleNamespace(is_connected=True)
+    hub.publish([ROW])
+    hub._loop.run_until_complete(asyncio.sleep(0))
+    assert queue.empty()
+    hub.publish([ROW], source="realtime")
+    hub._loop.run_until_complete(asyncio.sleep(0))
+    assert queue.get_nowait()["rows"] == 1
+
+
+def test_inserts_reach_the_hot_store_once(monkeypatch):
+    hub = _hub(monkeypatch)
+    appended = []
+    monkeypatch.setattr(live_updates.hot_store, "append", appended.extend)
+
+    hub._realtime = SimpleNamespace(is_connected=False)
+    hub.record_inserts([ROW])
+    assert appended == [ROW]
+
+    # With the relay connected the insert arrives once through it, as on every other instance
+    hub._realtime = SimpleNamespace(is_connected=True)
+    hub.record_inserts([ROW])
+    hub._on_insert({"data": {"record": ROW}})
+    hub._loop.run_until_complete(asyncio.sleep(0.05))
+    assert appended == [ROW, ROW]
+
+
+def test_relayed_inserts_resolve_departments_off_the_event_loop(monkeypatch):
+    hub = _hub(monkeypatch)
+    hub.subscribe("department", "1")
+    threads = []
+    monkeypatch.setattr(live_updates.hot_store, "append", lambda rows: None)
+    monkeypatch.setattr(live_updates.hierarchy, "ensure_department",
+                        lambda dept_id: threads.append(threading.current_thread()))
+    hub._on_insert({"data": {"record": ROW}})
+    hub._loop.run_until_complete(asyncio.sleep(0.05))
+    assert threads and threads[0] is not threading.main_thread()
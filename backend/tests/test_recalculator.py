@@ -0,0 +1,38 @@
+from app.services import calculator
+from app.services.recalculator import recompute_batch
+
+VERSIONS = [
+    {"id": 1, "factor": 0.5, "valid_from": "2020-01-01", "valid_to": "2023-12-31"},
+    {"id": 2, "factor": 0.8, "valid_from": "2024-01-01", "valid_to": None},
+]
+
+
+def _log(log_id, factor_id, value, co2e, day):
+    return {"id": log_id, "dept_id": 1, "factor_id": factor_id, "value": value,
+            "co2e_kg": co2e, "entry_type": "manual", "activity_date": day}
+
+
+def test_recompute_batch_returns_only_changed_rows():
+    rows = [
+        _log(1, 1, 10, 5.0, "2023-06-01"),   # already correct
+        _log(2, 1, 10, 5.0, "2024-02-01"),   # needs the newer version
+        _log(3, 2, 10, 7.0, "2024-03-01"),   # right version, stale value
+        _log(4, 2, 10, 8.0, "2019-05-01"),   # before the first version: earliest applies
+    ]
+    changes = {r["id"]: r for r in recompute_batch(rows, VERSIONS)}
+    assert set(changes) == {2, 3, 4}
+    assert (changes[2]["factor_id"], changes[2]["co2e_kg"]) == (2, 8.0)
+    assert (changes[3]["factor_id"], changes[3]["co2e_kg"]) == (2, 8.0)
+    assert (changes[4]["factor_id"], changes[4]["co2e_kg"]) == (1, 5.0)
+    assert recompute_batch([], VERSIONS) == []
+
+
+def test_calculate_co2e_resolves_version_by_activity_date(monkeypatch):
+    rows = [{**v, "category": "Energy", "activity": "Grid"} for v in VERSIONS]
+    monkeypatch.setattr(calculator, "fetch_all", lambda build_query: rows)
+    for name in ("_factor_cache", "_factor_categories", "_loaded_at"):
+        monkeypatch.setattr(calculator, name, getattr(calculator, name))  # restored after the test
+    calculator.load_factor_cache()
+    assert calculator.calculate_co2e("Energy", "Grid", 10, "2023-12-31") == (5.0, 1)
+    assert calculator.calculate_co2e("Energy", "Grid", 10, "2024-01-01") == (8.0, 2)
+    assert calculator.category_for_factor(2) == "Energy"
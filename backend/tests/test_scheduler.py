@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import scheduler as scheduler_module
+from app.services.scheduler import PrecomputeScheduler
+
+
+def _run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+class Computed(Exception):
+    """Raised in place of building a RecommendationEngine, i.e. once past the skip check"""
+
+
+def _no_engine():
+    raise Computed()
+
+
+def test_scope_is_skipped_only_without_new_logs_or_recalculation(monkeypatch):
+    sched = PrecomputeScheduler()
+    monkeypatch.setattr(scheduler_module, "latest_log_id", lambda scope_type, scope_id: 10)
+    monkeypatch.setattr(scheduler_module, "RecommendationEngine", _no_engine)
+
+    def skipped(marker, generation, force=False):
+        limit = asyncio.Semaphore(1)
+        try:
+            return _run(sched._precompute_scope("org", "o1", marker, generation, force, limit, limit)) == "skipped"
+        except Computed:
+            return False
+
+    assert skipped((10, "g1"), "g1")
+    assert not skipped((9, "g1"), "g1")
+    assert not skipped((10, "g1"), "g2")
+    assert not skipped((10, "g1"), "g1", force=True)
+    assert not skipped(None, None)
+
+
+def test_mark_stale_during_a_run_survives_it(monkeypatch):
+    sched = PrecomputeScheduler()
+    sched.mark_stale()
+    monkeypatch.setattr(scheduler_module, "data_generation", lambda: None)
+    monkeypatch.setattr(sched, "_load_markers", lambda: {})
+    monkeypatch.setattr(scheduler_module, "claim_pass", lambda daily: True)
+    monkeypatch.setattr(scheduler_module, "release_pass", lambda finished: None)
+
+    def scopes():
+        sched.mark_stale()  # e.g. a recalculation finishing mid-run
+        return []
+
+    monkeypatch.setattr(sched, "_scopes", scopes)
+    _run(sched.run_once())
+    assert sched._force
+
+
+def test_pass_is_skipped_when_another_instance_holds_the_lock(monkeypatch):
+    sched = PrecomputeScheduler()
+    sched.mark_stale()
+    released = []
+    monkeypatch.setattr(scheduler_module, "claim_pass", lambda daily: False)
+    monkeypatch.setattr(scheduler_module, "release_pass", released.append)
+    monkeypatch.setattr(sched, "_scopes", lambda: pytest.fail("walked the hierarchy without the lock"))
+    assert _run(sched.run_once(daily=True)) is None
+    assert sched._force and not sched._running and released == []
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        self.reads += 1
+        return SimpleNamespace(data=list(self.rows))
+
+
+def test_get_fresh_rereads_rows_recomputed_elsewhere(monkeypatch):
+    sched = PrecomputeScheduler()
+    sched._results[("org", "o1")] = {"last_log_id": 5, "generation": "g1", "aggregates": "old"}
+    db = FakeTable([{"last_log_id": 9, "generation": "g1", "aggregates": "new"}])
+    monkeypatch.setattr(scheduler_module, "supabase", db)
+    monkeypatch.setattr(scheduler_module, "data_generation", lambda: "g1")
+    monkeypatch.setattr(scheduler_module, "latest_log_id", lambda scope_type, scope_id: 9)
+
+    assert sched.get_fresh("org", "o1")["aggregates"] == "new"
+    assert sched.get_fresh("org", "o1")["aggregates"] == "new"
+    assert db.reads == 1  # served from the refreshed cache afterwards
@@ -0,0 +1,52 @@
+from datetime import date
+
+from app.scripts import seed_factors
+
+
+class FakeClient:
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+
+    def rpc(self, name, params):
+        if params["p_activity"] == self.fail_on:
+            raise RuntimeError("publish failed")
+        self.calls.append((name, params))
+        return self
+
+    def execute(self):
+        return None
+
+
+def _run(monkeypatch, existing, factors, fail_on=None):
+    client = FakeClient(fail_on)
+    jobs = []
+    monkeypatch.setattr(seed_factors, "supabase", client)
+    monkeypatch.setattr(seed_factors, "fetch_all", lambda build_query: existing)
+    monkeypatch.setattr(seed_factors, "OFFICIAL_FACTORS", factors)
+    monkeypatch.setattr(seed_factors, "create_job",
+                        lambda category, activity, since: jobs.append((activity, since)) or {"id": len(jobs)})
+    seed_factors.run_seed(recalculate=False)
+    return client.calls, jobs
+
+
+def _factor(activity, value, **extra):
+    return {"category": "Energy", "activity": activity, "factor": value, "unit": "kWh", "source": "test", **extra}
+
+
+def test_changed_value_becomes_a_new_version_from_today(monkeypatch):
+    existing = [{"id": 1, **_factor("Grid", 0.7), "valid_from": "2000-01-01", "valid_to": None},
+                {"id": 2, **_factor("Gas", 2.0), "valid_from": "2000-01-01", "valid_to": None}]
+    calls, jobs = _run(monkeypatch, existing, [_factor("Grid", 0.75), _factor("Gas", 2.0), _factor("Solar", 0.0)])
+    today = date.today().isoformat()
+    assert [(c[1]["p_activity"], c[1]["p_valid_from"]) for c in calls] == [("Grid", today), ("Solar", "2000-01-01")]
+    assert jobs == [("Grid", today)]
+
+
+def test_failed_publish_leaves_earlier_versions_queued(monkeypatch):
+    existing = [{"id": 1, **_factor("Grid", 0.7), "valid_from": "2000-01-01", "valid_to": None},
+                {"id": 2, **_factor("Gas", 2.0), "valid_from": "2000-01-01", "valid_to": None}]
+    calls, jobs = _run(monkeypatch, existing,
+                       [_factor("Grid", 0.75, valid_from="2025-04-01"), _factor("Gas", 2.1)], fail_on="Gas")
+    assert [c[1]["p_activity"] for c in calls] == ["Grid"]
+    assert jobs == [("Grid", "2025-04-01")]
@@ -0,0 +1,27 @@
+from app.services import warmup
+
+
+class _FakeQuery:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+
+def test_run_warmup_retries_failed_steps_until_ready(monkeypatch):
+    attempts = {"factors": 0}
+
+    def flaky_factors():
+        attempts["factors"] += 1
+        if attempts["factors"] < 3:
+            raise ConnectionError("temporary")
+
+    monkeypatch.setattr(warmup, "get_supabase", lambda: _FakeQuery())
+    monkeypatch.setattr(warmup, "load_factor_cache", flaky_factors)
+    monkeypatch.setattr(warmup.hierarchy, "load", lambda: 0)
+    monkeypatch.setattr(warmup, "RETRY_INITIAL", 0)
+    monkeypatch.setattr(warmup, "HOT_STORE_ENABLED", False)
+    monkeypatch.setattr(warmup, "readiness", {"supabase": False, "factors": False, "hierarchy": False, "hot_store": True})
+
+    warmup.run_warmup()
+
+    assert attempts["factors"] == 3
+    assert warmup.is_ready()
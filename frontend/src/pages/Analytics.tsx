@@ -5,8 +5,16 @@ import { TrendChart } from "@/components/analytics/TrendChart";
 import { BreakdownChart } from "@/components/analytics/BreakdownChart";
 import { TopEmittersTable } from "@/components/analytics/TopEmittersTable";
 import { useFilters } from "@/context/FilterContext";
-import { useEffect, useState } from "react";
-import { getEmissionsTotal, getEmissionsByCategory, getEmissionsByTime, getEmissionsByDepartment } from "@/services/api";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
+import {
+    getEmissionsTotal,
+    getEmissionsByCategory,
+    getEmissionsByTime,
+    getEmissionsByDepartment,
+    subscribeToAnalytics,
+    type AnalyticsDelta,
+    type AnalyticsScope,
+} from "@/services/api";
 import { Sparkles, Loader2 } from "lucide-react";
 
 interface CategoryData {
@@ -32,156 +40,215 @@ interface EmitterData {
     percent: number;
 }
 
+// Adds each amount in `amounts` to the matching entry, appending entries for new keys
+const addAmounts = <T,>(
+    items: T[],
+    amounts: Record<string, number>,
+    keyOf: (item: T) => string,
+    add: (item: T, amount: number) => T,
+    create: (key: string, amount: number) => T
+) => {
+    const next = [...items];
+    Object.entries(amounts).forEach(([key, amount]) => {
+        const index = next.findIndex((item) => keyOf(item) === key);
+        if (index >= 0) {
+            next[index] = add(next[index], amount);
+        } else {
+            next.push(create(key, amount));
+        }
+    });
+    return next;
+};
+
 export default function AnalyticsPage() {
     const { appliedFilters } = useFilters();
     const [totalEmissions, setTotalEmissions] = useState<number | null>(null);
     const [categoryData, setCategoryData] = useState<CategoryData[]>([]);
     const [departmentData, setDepartmentData] = useState<DepartmentData[]>([]);
     const [trendData, setTrendData] = useState<any[]>([]);
-    const [breakdownData, setBreakdownData] = useState<BreakdownData[]>([]);
-    const [topEmittersData, setTopEmittersData] = useState<EmitterData[]>([]);
     const [loading, setLoading] = useState(false);
+    const departmentIds = useRef<Set<string>>(new Set());
+
+    const loadAnalytics = useCallback(async (showSpinner: boolean) => {
+        if (!appliedFilters.orgId) {
+            setTotalEmissions(null);
+            setCategoryData([]);
+            setDepartmentData([]);
+            setTrendData([]);
+            return;
+        }
 
-    useEffect(() => {
-        const fetchData = async () => {
-            if (!appliedFilters.orgId) {
-                setTotalEmissions(null);
-                setCategoryData([]);
-                setDepartmentData([]);
-                setTrendData([]);
-                setBreakdownData([]);
-                setTopEmittersData([]);
-                return;
+        if (showSpinner) setLoading(true);
+        try {
+            // Fetch Total
+            const totalProm = getEmissionsTotal(
+                appliedFilters.orgId,
+                appliedFilters.branchId || undefined,
+                appliedFilters.deptId || undefined
+            );
+
+            // Fetch Category Breakdown
+            const catProm = getEmissionsByCategory(
+                appliedFilters.orgId,
+                appliedFilters.branchId || undefined,
+                appliedFilters.deptId || undefined
+            );
+
+            // Fetch Department Breakdown (only if not filtering by a specific dept)
+            const deptProm = !appliedFilters.deptId
+                ? getEmissionsByDepartment(
+                    appliedFilters.orgId,
+                    appliedFilters.branchId || undefined
+                )
+                : Promise.resolve([]);
+
+            // Fetch Trend
+            const trendProm = getEmissionsByTime(
+                appliedFilters.orgId,
+                appliedFilters.branchId || undefined,
+                appliedFilters.deptId || undefined,
+                "month"
+            );
+
+            const [totalRes, catRes, deptRes, trendRes] = await Promise.all([totalProm, catProm, deptProm, trendProm]);
+
+            // Handle Total - API may return number directly or array with objects
+            let total = 0;
+            if (totalRes !== null && totalRes !== undefined) {
+                if (typeof totalRes === 'number') {
+                    // Org total returns a direct number
+                    total = totalRes;
+                } else if (Array.isArray(totalRes) && totalRes.length > 0) {
+                    // Branch/Dept totals return array with objects
+                    total = totalRes[0].total_emissions || 0;
+                } else if (typeof totalRes === 'object' && 'total_emissions' in totalRes) {
+                    // Single object response
+                    total = totalRes.total_emissions || 0;
+                }
+                setTotalEmissions(total);
+            } else {
+                setTotalEmissions(0);
             }
 
-            setLoading(true);
-            try {
-                // Fetch Total
-                const totalProm = getEmissionsTotal(
-                    appliedFilters.orgId,
-                    appliedFilters.branchId || undefined,
-                    appliedFilters.deptId || undefined
-                );
+            // Handle Category
+            if (catRes) {
+                const formattedCat: CategoryData[] = catRes.map((item: any) => ({
+                    name: item.category || item.category_name || "Unknown",
+                    value: item.total_emissions || item.value || 0,
+                    ...item
+                }));
+                setCategoryData(formattedCat);
+            }
 
-                // Fetch Category Breakdown
-                const catProm = getEmissionsByCategory(
-                    appliedFilters.orgId,
-                    appliedFilters.branchId || undefined,
-                    appliedFilters.deptId || undefined
-                );
-
-                // Fetch Department Breakdown (only if not filtering by a specific dept)
-                const deptProm = !appliedFilters.deptId
-                    ? getEmissionsByDepartment(
-                        appliedFilters.orgId,
-                        appliedFilters.branchId || undefined
-                    )
-                    : Promise.resolve([]);
-
-                // Fetch Trend
-                const trendProm = getEmissionsByTime(
-                    appliedFilters.orgId,
-                    appliedFilters.branchId || undefined,
-                    appliedFilters.deptId || undefined,
-                    "month"
-                );
-
-                const [totalRes, catRes, deptRes, trendRes] = await Promise.all([totalProm, catProm, deptProm, trendProm]);
-
-                // Handle Total - API may return number directly or array with objects
-                let total = 0;
-                if (totalRes !== null && totalRes !== undefined) {
-                    if (typeof totalRes === 'number') {
-                        // Org total returns a direct number
-                        total = totalRes;
-                    } else if (Array.isArray(totalRes) && totalRes.length > 0) {
-                        // Branch/Dept totals return array with objects
-                        total = totalRes[0].total_emissions || 0;
-                    } else if (typeof totalRes === 'object' && 'total_emissions' in totalRes) {
-                        // Single object response
-                        total = totalRes.total_emissions || 0;
-                    }
-                    setTotalEmissions(total);
-                } else {
-                    setTotalEmissions(0);
-                }
+            // Handle Department
+            setDepartmentData(deptRes && deptRes.length > 0 ? deptRes : []);
+
+            // Handle Trend
+            if (trendRes) {
+                const formatted = trendRes.map((item: any) => ({
+                    name: item.period_start || item.period,
+                    date: item.period_start || item.period,
+                    emissions: item.total_emissions
+                }));
+                setTrendData(formatted);
+            }
 
-                // Handle Category
-                let formattedCat: CategoryData[] = [];
-                if (catRes) {
-                    formattedCat = catRes.map((item: any) => ({
-                        name: item.category || item.category_name || "Unknown",
-                        value: item.total_emissions || item.value || 0,
-                        ...item
-                    }));
-                    setCategoryData(formattedCat);
-                }
+        } catch (error) {
+            console.error("Failed to fetch analytics data", error);
+        } finally {
+            if (showSpinner) setLoading(false);
+        }
+    }, [appliedFilters]);
 
-                // Handle Department
-                if (deptRes && deptRes.length > 0) {
-                    setDepartmentData(deptRes);
-
-                    // Create breakdown data for BreakdownChart
-                    // This shows each department's emissions breakdown
-                    const breakdown: BreakdownData[] = deptRes.slice(0, 5).map((dept: DepartmentData) => ({
-                        name: dept.dept_name.length > 12 ? dept.dept_name.slice(0, 12) + '...' : dept.dept_name,
-                        Emissions: dept.total_emissions
-                    }));
-                    setBreakdownData(breakdown);
-
-                    // Create top emitters data combining dept info
-                    // Show top emitting departments with their contribution %
-                    const emitters: EmitterData[] = deptRes
-                        .slice(0, 6)
-                        .map((dept: DepartmentData) => ({
-                            dept_name: dept.dept_name,
-                            category: "All Categories",
-                            emissions: dept.total_emissions,
-                            percent: total > 0 ? (dept.total_emissions / total) * 100 : 0
-                        }));
-                    setTopEmittersData(emitters);
-                } else if (appliedFilters.deptId) {
-                    setDepartmentData([]);
-                    setBreakdownData([]);
-                    // When filtering by specific dept, show category breakdown as emitters
-                    if (formattedCat.length > 0) {
-                        const emitters: EmitterData[] = formattedCat
-                            .slice(0, 6)
-                            .map((cat) => ({
-                                dept_name: "Selected Dept",
-                                category: cat.name,
-                                emissions: cat.value,
-                                percent: total > 0 ? (cat.value / total) * 100 : 0
-                            }));
-                        setTopEmittersData(emitters);
-                    } else {
-                        setTopEmittersData([]);
-                    }
-                } else {
-                    setDepartmentData([]);
-                    setBreakdownData([]);
-                    setTopEmittersData([]);
-                }
+    useEffect(() => {
+        loadAnalytics(true);
+    }, [loadAnalytics]);
 
-                // Handle Trend
-                if (trendRes) {
-                    const formatted = trendRes.map((item: any) => ({
-                        name: item.period_start || item.period,
-                        date: item.period_start || item.period,
-                        emissions: item.total_emissions
-                    }));
-                    setTrendData(formatted);
-                }
+    useEffect(() => {
+        departmentIds.current = new Set(departmentData.map((dept) => String(dept.dept_id)));
+    }, [departmentData]);
+
+    // Live updates: apply the server's deltas to the loaded data instead of re-fetching every chart
+    useEffect(() => {
+        if (!appliedFilters.orgId) return;
+        const [scopeType, scopeId]: [AnalyticsScope, string] = appliedFilters.deptId
+            ? ["department", String(appliedFilters.deptId)]
+            : appliedFilters.branchId
+                ? ["branch", appliedFilters.branchId]
+                : ["org", appliedFilters.orgId];
+
+        const applyDelta = (delta: AnalyticsDelta) => {
+            // A department we have no name for yet: fetch the breakdown again
+            if (!appliedFilters.deptId && Object.keys(delta.departments).some((id) => !departmentIds.current.has(id))) {
+                loadAnalytics(false);
+                return;
+            }
 
-            } catch (error) {
-                console.error("Failed to fetch analytics data", error);
-            } finally {
-                setLoading(false);
+            setTotalEmissions((prev) => (prev || 0) + delta.total);
+            setCategoryData((prev) => addAmounts(
+                prev,
+                delta.categories,
+                (cat) => cat.name,
+                (cat, amount) => ({ ...cat, value: cat.value + amount }),
+                (name, amount) => ({ name, value: amount })
+            ));
+            if (!appliedFilters.deptId) {
+                setDepartmentData((prev) => addAmounts(
+                    prev,
+                    delta.departments,
+                    (dept) => String(dept.dept_id),
+                    (dept, amount) => ({ ...dept, total_emissions: dept.total_emissions + amount }),
+                    (id, amount) => ({ dept_id: id, dept_name: "Unknown", total_emissions: amount })
+                ).sort((a, b) => b.total_emissions - a.total_emissions));
             }
+            setTrendData((prev) => addAmounts(
+                prev,
+                delta.periods.month,
+                (point: any) => String(point.date).slice(0, 10),
+                (point: any, amount) => ({ ...point, emissions: (point.emissions || 0) + amount }),
+                (period, amount) => ({ name: period, date: period, emissions: amount })
+            ).sort((a: any, b: any) => String(a.date).localeCompare(String(b.date))));
         };
 
-        fetchData();
-    }, [appliedFilters]);
+        return subscribeToAnalytics(scopeType, scopeId, (message) => {
+            if (message.type === "delta") {
+                applyDelta(message);
+            } else if (message.type === "resync") {
+                loadAnalytics(false);
+            }
+        });
+    }, [appliedFilters, loadAnalytics]);
+
+    // Department breakdown and top emitters follow from the loaded (and live-updated) data
+    const breakdownData = useMemo<BreakdownData[]>(() =>
+        // This shows each department's emissions breakdown
+        departmentData.slice(0, 5).map((dept) => ({
+            name: dept.dept_name.length > 12 ? dept.dept_name.slice(0, 12) + '...' : dept.dept_name,
+            Emissions: dept.total_emissions
+        })), [departmentData]);
+
+    const topEmittersData = useMemo<EmitterData[]>(() => {
+        const total = totalEmissions || 0;
+        if (departmentData.length > 0) {
+            // Show top emitting departments with their contribution %
+            return departmentData.slice(0, 6).map((dept) => ({
+                dept_name: dept.dept_name,
+                category: "All Categories",
+                emissions: dept.total_emissions,
+                percent: total > 0 ? (dept.total_emissions / total) * 100 : 0
+            }));
+        }
+        if (appliedFilters.deptId) {
+            // When filtering by specific dept, show category breakdown as emitters
+            return categoryData.slice(0, 6).map((cat) => ({
+                dept_name: "Selected Dept",
+                category: cat.name,
+                emissions: cat.value,
+                percent: total > 0 ? (cat.value / total) * 100 : 0
+            }));
+        }
+        return [];
+    }, [departmentData, categoryData, totalEmissions, appliedFilters.deptId]);
 
     const handleExport = () => {
         if ((!totalEmissions && totalEmissions !== 0) || categoryData.length === 0) {
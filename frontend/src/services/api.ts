@@ -84,10 +84,22 @@ export const getEmissionsTotal = async (
     return json.data;
 };
 
+// Appends start_date/end_date (YYYY-MM-DD) so the server can answer recent ranges from its hot store
+const withDateRange = (url: string, startDate?: string, endDate?: string) => {
+    const params = new URLSearchParams();
+    if (startDate) params.append("start_date", startDate);
+    if (endDate) params.append("end_date", endDate);
+    const query = params.toString();
+    if (!query) return url;
+    return `${url}${url.includes("?") ? "&" : "?"}${query}`;
+};
+
 export const getEmissionsByCategory = async (
     orgId?: string,
     branchId?: string,
-    deptId?: number
+    deptId?: number,
+    startDate?: string,
+    endDate?: string
 ) => {
     let url = "";
     if (deptId) {
@@ -100,7 +112,7 @@ export const getEmissionsByCategory = async (
         return null;
     }
 
-    const response = await fetch(url);
+    const response = await fetch(withDateRange(url, startDate, endDate));
     const json = await response.json();
     return json.data;
 };
@@ -109,7 +121,9 @@ export const getEmissionsByTime = async (
     orgId?: string,
     branchId?: string,
     deptId?: number,
-    period: "day" | "week" | "month" | "year" = "month"
+    period: "day" | "week" | "month" | "year" = "month",
+    startDate?: string,
+    endDate?: string
 ) => {
     let url = "";
     if (deptId) {
@@ -124,14 +138,16 @@ export const getEmissionsByTime = async (
         return null;
     }
 
-    const response = await fetch(url);
+    const response = await fetch(withDateRange(url, startDate, endDate));
     const json = await response.json();
     return json.data;
 };
 
 export const getEmissionsByDepartment = async (
     orgId?: string,
-    branchId?: string
+    branchId?: string,
+    startDate?: string,
+    endDate?: string
 ) => {
     let url = "";
     if (branchId) {
@@ -142,7 +158,7 @@ export const getEmissionsByDepartment = async (
         return null;
     }
 
-    const response = await fetch(url);
+    const response = await fetch(withDateRange(url, startDate, endDate));
     const json = await response.json();
     return json.data;
 };
@@ -233,3 +249,67 @@ export const uploadCSVLogs = async (deptId: string, file: File) => {
     const json = await response.json();
     return json;
 };
+
+export type AnalyticsScope = "department" | "branch" | "org";
+
+export interface AnalyticsDelta {
+    type: "delta";
+    scope_type: AnalyticsScope;
+    scope_id: string;
+    rows: number;
+    total: number;
+    periods: Record<"day" | "week" | "month" | "year", Record<string, number>>;
+    categories: Record<string, number>;
+    departments: Record<string, number>;
+}
+
+export type AnalyticsMessage =
+    | AnalyticsDelta
+    | { type: "resync"; scope_type: AnalyticsScope; scope_id: string }
+    | { type: "ping" };
+
+// Opens the live analytics feed for one scope and reconnects with backoff until the returned function is called
+export const subscribeToAnalytics = (
+    scopeType: AnalyticsScope,
+    scopeId: string,
+    onMessage: (message: AnalyticsMessage) => void
+) => {
+    const url = `${API_URL.replace(/^http/, "ws")}/ws/analytics/${scopeType}/${encodeURIComponent(scopeId)}`;
+    let socket: WebSocket | null = null;
+    let retryDelay = 1000;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+    let dropped = false;
+
+    const connect = () => {
+        socket = new WebSocket(url);
+        socket.onopen = () => {
+            retryDelay = 1000;
+            if (dropped) {
+                // Updates were missed while disconnected
+                dropped = false;
+                onMessage({ type: "resync", scope_type: scopeType, scope_id: scopeId });
+            }
+        };
+        socket.onmessage = (event) => {
+            try {
+                onMessage(JSON.parse(event.data));
+            } catch (error) {
+                console.error("Invalid analytics update", error);
+            }
+        };
+        socket.onclose = () => {
+            if (closed) return;
+            dropped = true;
+            retryTimer = setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        };
+    };
+
+    connect();
+    return () => {
+        closed = true;
+        clearTimeout(retryTimer);
+        socket?.close();
+    };
+};